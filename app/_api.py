@@ -0,0 +1,283 @@
+"""Backend access for the dashboard: API clients, cached fetchers and their invalidation.
+
+Imported once per process, so the clients and cached functions here are not
+redefined on every Streamlit rerun.
+"""
+import httpx
+import orjson
+import threading
+from collections import OrderedDict
+import pyarrow as pa
+import pandas as pd
+import streamlit as st
+import os
+
+# Backend URL: prefer Streamlit secrets or env var, else fallback to localhost
+try:
+    API = st.secrets["api"].rstrip("/")
+except Exception:
+    API = os.environ.get("IAQ_API", "http://127.0.0.1:8000").rstrip("/")
+
+@st.cache_resource(show_spinner=False)
+def get_backend():
+    """Import the FastAPI app (and its SQLite setup) once per process."""
+    from backend.main import app
+    return app
+
+@st.cache_resource(show_spinner=False)
+def _local_client():
+    """Create an in-process client bound to the FastAPI app.
+    Returns (client, mode) or (None, reason).
+
+    httpx's ASGITransport only works with an async client, so the sync path goes
+    through FastAPI's TestClient, which calls the app directly without a socket.
+    """
+    try:
+        fastapi_app = get_backend()
+    except Exception as e:
+        return None, f"import_error: {e}"
+    try:
+        from fastapi.testclient import TestClient
+        client = TestClient(fastapi_app)
+        return client, "testclient"
+    except Exception as e:
+        return None, f"client_error: {e}"
+
+@st.cache_resource(show_spinner=False)
+def _http_client(base_url: str):
+    """One pooled keep-alive client for the external API, shared across reruns."""
+    return httpx.Client(base_url=base_url, timeout=5.0,
+                        limits=httpx.Limits(max_keepalive_connections=4))
+
+# one refresh tick; the live fragments rerun on this period
+REFRESH_SECONDS = 5
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+# resolved once up front instead of on every api_get/api_post call
+CLIENT, LOCAL_MODE = _local_client()
+HTTP = _http_client(API)
+
+def decode_body(content_type: str, content: bytes):
+    # Arrow bodies become a DataFrame directly; everything else is JSON
+    if content_type.startswith(ARROW_MEDIA_TYPE):
+        table = pa.ipc.open_stream(content).read_all()
+        return table.to_pandas(split_blocks=True, self_destruct=True)
+    return orjson.loads(content)
+
+def decode_response(resp):
+    return decode_body(resp.headers.get("content-type", ""), resp.content)
+
+@st.cache_resource(show_spinner=False)
+def _etag_store() -> OrderedDict:
+    """(path, params) -> (etag, content type, raw body), shared across sessions, oldest use first."""
+    return OrderedDict()
+
+ETAGS = _etag_store()
+ETAG_STORE_MAX = 256
+# sessions run on separate threads; reordering and eviction must not interleave
+_ETAG_LOCK = threading.Lock()
+
+def conditional_get(client, path: str, params: tuple):
+    """GET with If-None-Match; a 304 re-decodes the body stored with that tag.
+
+    Raw bytes are kept rather than the decoded value so callers can never mutate it.
+    """
+    key = (path, params)
+    # `since` requests move with every tick and are never repeated; storing them would
+    # only push out the stable entries the 304 path is for
+    storable = all(k != "since" for k, _ in params)
+    held = ETAGS.get(key) if storable else None
+    resp = client.get(path, params=dict(params), headers={"If-None-Match": held[0]} if held else None)
+    if resp.status_code == 304 and held:
+        with _ETAG_LOCK:
+            if key in ETAGS:
+                ETAGS.move_to_end(key)
+        return decode_body(held[1], held[2])
+    resp.raise_for_status()
+    tag = resp.headers.get("etag")
+    if tag and storable:
+        with _ETAG_LOCK:
+            ETAGS[key] = (tag, resp.headers.get("content-type", ""), resp.content)
+            ETAGS.move_to_end(key)
+            # evict least recently used instead of dropping everything
+            while len(ETAGS) > ETAG_STORE_MAX:
+                ETAGS.popitem(last=False)
+    return decode_response(resp)
+
+def api_get(path: str, params=None):
+    # canonical cache key: None-valued params dropped, items sorted
+    items = tuple(sorted((k, v) for k, v in (params or {}).items() if v is not None))
+    return _api_get_cached(path, items)
+
+# raw API responses only live for one refresh tick; this bounds how stale the
+# "/" health probe that drives sync_caches() can be
+@st.cache_data(ttl=REFRESH_SECONDS)
+def _api_get_cached(path: str, params: tuple):
+    # Prefer embedded (in-process) client first so Streamlit Cloud works without TCP
+    if CLIENT is not None:
+        try:
+            body = conditional_get(CLIENT, path, params)
+            st.session_state["use_local_api"] = True
+            st.session_state["local_api_mode"] = LOCAL_MODE
+            st.session_state.pop("api_error", None)
+            return body
+        except Exception as e:
+            st.session_state["api_error"] = f"embedded_{LOCAL_MODE}_error: {e}"
+    # Fallback to external HTTP API if provided
+    try:
+        body = conditional_get(HTTP, path, params)
+        st.session_state["use_local_api"] = False
+        st.session_state.pop("api_error", None)
+        return body
+    except Exception as e:
+        st.session_state["api_error"] = f"http_error: {e}"
+        raise RuntimeError("API not reachable") from e
+
+
+def api_post(path: str, json=None):
+    if CLIENT is not None:
+        try:
+            resp = CLIENT.post(path, json=json or {})
+            resp.raise_for_status()
+            st.session_state["use_local_api"] = True
+            st.session_state["local_api_mode"] = LOCAL_MODE
+            st.session_state.pop("api_error", None)
+            return orjson.loads(resp.content)
+        except Exception as e:
+            st.session_state["api_error"] = f"embedded_{LOCAL_MODE}_error: {e}"
+    try:
+        r = HTTP.post(path, json=json or {}, timeout=15)
+        r.raise_for_status()
+        st.session_state["use_local_api"] = False
+        st.session_state.pop("api_error", None)
+        return orjson.loads(r.content)
+    except Exception as e:
+        st.session_state["api_error"] = f"http_error: {e}"
+        raise RuntimeError("API not reachable") from e
+
+# data caches outlive many refresh ticks and are cleared by sync_caches() when the
+# backend reports a newer reading, rather than expiring on every tick
+DATA_TTL = 60
+
+@st.cache_data(ttl=DATA_TTL)
+def get_sites():
+    try:
+        sites_from_db = api_get("/sites")
+        # Always show all possible sites, even if no data yet
+        all_sites = ["Lab", "Classroom", "Canteen"]
+        # Merge: prioritize DB sites, then add missing defaults
+        for s in all_sites:
+            if s not in sites_from_db:
+                sites_from_db.append(s)
+        return sites_from_db
+    except Exception:
+        return ["Lab", "Classroom", "Canteen"]
+
+READING_COLS = ["ts","pm25","co2","temp","rh","pm25_index","pm25_category","site","source"]
+
+# the window the live panels poll; /dashboard bundles everything for it
+DASHBOARD_WINDOW = "24h"
+
+@st.cache_data(ttl=DATA_TTL)
+def get_dashboard(site=None, window=DASHBOARD_WINDOW):
+    """Exposure, events, summary stats and per-site latest rows in one round-trip.
+
+    Readings are left out of the bundle; get_readings pulls them as Arrow.
+    """
+    return api_get("/dashboard", {"site": site, "window": window, "include_readings": False})
+
+def ensure_ts(df: pd.DataFrame) -> pd.DataFrame:
+    """Parse `ts` only if it isn't datetime64 yet; Arrow frames arrive typed."""
+    if not pd.api.types.is_datetime64_any_dtype(df["ts"]):
+        # isoformat() drops zero microseconds, hence ISO8601 rather than an inferred format
+        df["ts"] = pd.to_datetime(df["ts"], utc=True, format="ISO8601", cache=True)
+    return df
+
+def fetch_readings(params: dict) -> pd.DataFrame:
+    """`/readings` as a frame: Arrow when the backend has pyarrow, else the columns layout."""
+    data = api_get("/readings", {**params, "layout": "arrow"})
+    if not isinstance(data, pd.DataFrame):
+        data = pd.DataFrame(data["columns"], columns=READING_COLS)
+    return ensure_ts(data)
+
+@st.cache_data(ttl=DATA_TTL)
+def get_readings(site=None, window=DASHBOARD_WINDOW, limit=None):
+    try:
+        return fetch_readings({"site": site, "window": window, "limit": limit})
+    except Exception:
+        return ensure_ts(pd.DataFrame(columns=READING_COLS))
+
+def live_readings(site):
+    """Window frame for the live fragment, topped up with `/readings?since=` deltas.
+
+    The full window is fetched once per site; later ticks only pull rows newer than
+    the last one held and drop rows that fell out of the window. sync_caches drops
+    the frames whenever the backend's history changed other than by appending.
+    """
+    cache = st.session_state.setdefault("df_cache", {})
+    df = cache.get(site)
+    if df is None or df.empty:
+        df = cache[site] = get_readings(site=site)
+        return df
+    try:
+        # stored ts are datetime.isoformat() strings, which Timestamp.isoformat() reproduces
+        delta = fetch_readings({"site": site, "since": df["ts"].iloc[-1].isoformat()})
+    except Exception:
+        return df
+    if delta.empty:
+        return df
+    df = pd.concat([df, delta], ignore_index=True)
+    # anchor like the backend's window: at the newest reading of any site, not this one's
+    last = st.session_state.get("last_seen_ts")
+    end = pd.Timestamp(last) if last else df["ts"].iloc[-1]
+    df = df[df["ts"] >= end - pd.Timedelta(DASHBOARD_WINDOW)].reset_index(drop=True)
+    cache[site] = df
+    return df
+
+@st.cache_data(ttl=DATA_TTL)
+def get_exposure(window="24h", site=None):
+    try:
+        if window == DASHBOARD_WINDOW:
+            return get_dashboard(site, window)["exposure"]
+        params = {"window": window}
+        if site: params["site"] = site
+        return api_get("/exposure", params)
+    except Exception:
+        return {"window":window,"good":0,"satisfactory":0,"moderate":0,"poor":0,"very_poor":0,"severe":0}
+
+def clear_data_caches(reset_live=True):
+    _api_get_cached.clear(); get_dashboard.clear(); get_readings.clear(); get_exposure.clear(); get_sites.clear()
+    # seed/reset/ingest can rewrite history, so the delta-fed live frame starts over
+    if reset_live:
+        st.session_state.pop("df_cache", None)
+
+def sync_caches(health=None):
+    """Drop the data caches once the backend's newest reading differs from the last one seen."""
+    if health is None:
+        try:
+            health = api_get("/")
+        except Exception:
+            return
+    last, count = health.get("last"), health.get("count")
+    prev, prev_count = st.session_state.get("last_seen_ts"), st.session_state.get("count_seen")
+    if (prev, prev_count) == (last, count):
+        return
+    st.session_state["last_seen_ts"], st.session_state["count_seen"] = last, count
+    # newest ts vanished or went back: history was rewritten (reset, re-seed),
+    # so the delta-fed live frame can't be topped up and must start over
+    rewritten = prev is not None and (last is None or last < prev)
+    if not rewritten and prev is not None and prev_count is not None:
+        rewritten = not only_appended(prev, count - prev_count)
+    clear_data_caches(reset_live=rewritten)
+
+def only_appended(since, added) -> bool:
+    """True when the `added` new rows all sit after `since`; False if any landed behind
+    it (backdated ingest, interleaved seed) or rows were deleted."""
+    if added <= 0:
+        return False
+    try:
+        data = api_get("/readings", {"since": since, "limit": added + 1, "layout": "columns"})
+    except Exception:
+        return True
+    return len(data["columns"]["ts"]) == added
@@ -1,12 +1,10 @@
-import requests
 import pandas as pd
 import numpy as np
-import plotly.express as px
 import plotly.graph_objects as go
 import streamlit as st
 from datetime import datetime
 from pathlib import Path
-import os
+import time
 import sys
 
 # Ensure repo root is on sys.path so `backend` is importable on Streamlit Cloud
@@ -16,72 +14,26 @@ if str(_repo_root) not in sys.path:
 
 st.set_page_config(page_title="IAQ Dashboard", layout="wide")
 
-# styles (resolve relative to this file so it works from any CWD)
-_style_path = Path(__file__).resolve().parent / "styles.html"
-try:
-    with open(_style_path, "r", encoding="utf-8") as f:
-        st.markdown(f.read(), unsafe_allow_html=True)
-except FileNotFoundError:
-    st.markdown("", unsafe_allow_html=True)
-
-# Backend URL: prefer Streamlit secrets or env var, else fallback to localhost
-try:
-    API = st.secrets["api"].rstrip("/")
-except Exception:
-    API = os.environ.get("IAQ_API", "http://127.0.0.1:8000").rstrip("/")
-
-# Optionally start embedded FastAPI if external API is not reachable (helps on Streamlit Cloud)
-try:
-    _EMBED_ON_FAIL = str(st.secrets.get("embed_api", "1")) == "1"
-except Exception:
-    _EMBED_ON_FAIL = os.environ.get("IAQ_EMBED_API", "1") == "1"
+from _api import (API, REFRESH_SECONDS, api_get, api_post, get_sites,
+                  get_dashboard, get_readings, live_readings, get_exposure,
+                  clear_data_caches, sync_caches)
 
+# styles (resolve relative to this file so it works from any CWD)
 @st.cache_resource(show_spinner=False)
-def _spawn_embedded_api():
-    import threading, time
+def _styles() -> str:
+    """styles.html, read once per process rather than on every rerun."""
     try:
-        from backend.main import app as fastapi_app
-        import uvicorn
-    except Exception as e:
-        return f"import_error: {e}"
-    def _run():
-        uvicorn.run(fastapi_app, host="127.0.0.1", port=int(os.environ.get("IAQ_PORT", "8000")), log_level="warning")
-    th = threading.Thread(target=_run, daemon=True)
-    th.start()
-    time.sleep(1.5)
-    return "started"
+        return (Path(__file__).resolve().parent / "styles.html").read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return ""
 
-@st.cache_resource(show_spinner=False)
-def _local_client():
-    """Create a local client bound to the FastAPI app, trying httpx first,
-    then FastAPI's TestClient. Returns (client, mode) or (None, reason).
-    """
-    try:
-        from backend.main import app as fastapi_app
-    except Exception as e:
-        return None, f"import_error: {e}"
-    # Try httpx ASGI transport
-    try:
-        import httpx
-        from httpx import ASGITransport
-        transport = ASGITransport(app=fastapi_app)
-        client = httpx.Client(transport=transport, base_url="http://local")
-        return client, "httpx"
-    except Exception as e_httpx:
-        # Fallback to TestClient
-        try:
-            from fastapi.testclient import TestClient
-            client = TestClient(fastapi_app)
-            return client, "testclient"
-        except Exception as e_tc:
-            return None, f"client_error: {e_httpx}; {e_tc}"
+st.markdown(_styles(), unsafe_allow_html=True)
 
 st.title("An IoT-Based Indoor Air Quality Management")
 
-# Auto-refresh every 5 seconds
-st_autorefresh = st.empty()
-with st_autorefresh:
-    st.caption("🔄 Auto-refreshing every 5 seconds...")
+# Auto-refresh: the live section is a fragment that the browser reruns on a timer,
+# so the script thread is never blocked and widgets stay responsive
+st.caption(f"🔄 Auto-refreshing every {REFRESH_SECONDS} seconds...")
 
 # helpers
 CPCB_COLORS = {
@@ -93,102 +45,391 @@ CPCB_COLORS = {
     "Severe": "#7E0023",
 }
 
-@st.cache_data(ttl=5)
-def api_get(path: str, params=None):
-    # Prefer embedded (in-process) client first so Streamlit Cloud works without TCP
-    client, local_mode = _local_client()
-    if client is not None:
-        try:
-            resp = client.get(path, params=params or {})
-            resp.raise_for_status()
-            st.session_state["use_local_api"] = True
-            st.session_state["local_api_mode"] = local_mode
-            st.session_state.pop("api_error", None)
-            return resp.json()
-        except Exception as e:
-            st.session_state["api_error"] = f"embedded_{local_mode}_error: {e}"
-    # Fallback to external HTTP API if provided
-    try:
-        r = requests.get(f"{API}{path}", params=params or {}, timeout=5)
-        r.raise_for_status()
-        st.session_state["use_local_api"] = False
-        st.session_state.pop("api_error", None)
-        return r.json()
-    except Exception as e:
-        st.session_state["api_error"] = f"http_error: {e}"
-        raise RuntimeError("API not reachable") from e
+CATEGORY_ICONS = {
+    "Good": "🟢", "Satisfactory": "🟡", "Moderately Polluted": "🟠",
+    "Poor": "🔴", "Very Poor": "🟣", "Severe": "🟤",
+}
 
+def fmt_age(seconds: float) -> str:
+    """'42s ago' / '7m ago' / '1.5h ago'."""
+    if seconds < 60:
+        return f"{seconds:.0f}s ago"
+    if seconds < 3600:
+        return f"{seconds/60:.0f}m ago"
+    return f"{seconds/3600:.1f}h ago"
+
+# the trend chart is at most ~1-2k px wide; LTTB keeps it visually lossless at this size
+TREND_MAX_POINTS = 800
+# below this many plotted points per trace the trend chart stays on SVG scatter; with
+# LTTB capping traces at TREND_MAX_POINTS that is always the case unless the cap is raised
+SCATTERGL_MIN_POINTS = 1000
+
+def minmax_downsample(y: np.ndarray, n_out: int = TREND_MAX_POINTS) -> np.ndarray:
+    """Indices that keep the min and max of each bucket, so peaks survive downsampling."""
+    n = len(y)
+    if n <= n_out:
+        return np.arange(n)
+    n_buckets = max(1, (n_out - 2) // 2)
+    edges = np.linspace(1, n - 1, n_buckets + 1).astype(np.int64)
+    # NaN gaps must never win the min/max race
+    lo = np.where(np.isnan(y), np.inf, y)
+    hi = np.where(np.isnan(y), -np.inf, y)
+    idx = [0, n - 1]
+    for a, b in zip(edges[:-1], edges[1:]):
+        if b > a:
+            idx.append(a + int(np.argmin(lo[a:b])))
+            idx.append(a + int(np.argmax(hi[a:b])))
+    return np.unique(idx)
+
+def lttb_downsample(x: np.ndarray, y: np.ndarray, n_out: int = TREND_MAX_POINTS) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets indices; long inputs are min/max-preselected first."""
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    pre = None
+    if n > 4 * n_out:
+        # MinMaxLTTB: keeps this O(n) vectorised and the loop below short
+        pre = minmax_downsample(y, 4 * n_out)
+        x, y = x[pre], y[pre]
+        n = len(y)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    out = np.empty(n_out, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # third triangle vertex: mean of the next bucket, or the last point
+        if i + 2 < len(edges):
+            cx, cy = x[hi:edges[i + 2]].mean(), y[hi:edges[i + 2]].mean()
+        else:
+            cx, cy = x[-1], y[-1]
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(np.nan_to_num(area, nan=-1.0)))
+        out[i + 1] = a
+    return out if pre is None else pre[out]
 
-def api_post(path: str, json=None):
-    client, local_mode = _local_client()
-    if client is not None:
-        try:
-            resp = client.post(path, json=json or {})
-            resp.raise_for_status()
-            st.session_state["use_local_api"] = True
-            st.session_state["local_api_mode"] = local_mode
-            st.session_state.pop("api_error", None)
-            return resp.json()
-        except Exception as e:
-            st.session_state["api_error"] = f"embedded_{local_mode}_error: {e}"
-    try:
-        r = requests.post(f"{API}{path}", json=json or {}, timeout=15)
-        r.raise_for_status()
-        st.session_state["use_local_api"] = False
-        st.session_state.pop("api_error", None)
-        return r.json()
-    except Exception as e:
-        st.session_state["api_error"] = f"http_error: {e}"
-        raise RuntimeError("API not reachable") from e
-@st.cache_data(ttl=5)
-def get_sites():
-    try:
-        sites_from_db = api_get("/sites")
-        # Always show all possible sites, even if no data yet
-        all_sites = ["Lab", "Classroom", "Canteen"]
-        # Merge: prioritize DB sites, then add missing defaults
-        for s in all_sites:
-            if s not in sites_from_db:
-                sites_from_db.append(s)
-        return sites_from_db
-    except Exception:
-        return ["Lab", "Classroom", "Canteen"]
+def ts_nanos(ts: pd.Series) -> np.ndarray:
+    """Epoch nanoseconds as int64, straight from the datetime64 buffer."""
+    return ts.to_numpy(dtype="datetime64[ns]").view(np.int64)
 
-@st.cache_data(ttl=5)
-def get_readings(limit=5000, site=None, window=None):
-    try:
-        params = {"limit": limit}
-        if site: params["site"] = site
-        if window: params["window"] = window
-        data = api_get("/readings", params)
-        return pd.DataFrame(data)
-    except Exception:
-        return pd.DataFrame(columns=["ts","pm25","co2","temp","rh","pm25_index","pm25_category","site","source"])    
+# fewer points than this make a meaningless trend
+MIN_FIT_POINTS = 10
 
-@st.cache_data(ttl=5)
-def get_exposure(window="24h", site=None):
+def linfit(x: np.ndarray, y: np.ndarray):
+    """Closed-form least-squares line (slope, intercept), or None if it can't be fit.
+
+    Same result as np.polyfit(x, y, 1) without the Vandermonde matrix and LAPACK call;
+    non-finite pairs are dropped first.
+    """
+    ok = np.isfinite(x) & np.isfinite(y)
+    if ok.sum() < MIN_FIT_POINTS:
+        return None
+    x, y = x[ok], y[ok]
+    xm, ym = x.mean(), y.mean()
+    dx = x - xm
+    denom = (dx * dx).sum()
+    if denom == 0:
+        return None
+    slope = (dx * (y - ym)).sum() / denom
+    return float(slope), float(ym - slope * xm)
+
+# CO2 decay is fit over ~3h, the PM2.5 trend over the last hour (1-min cadence)
+ACH_POINTS, FORECAST_POINTS = 180, 60
+CO2_BASELINE = 400.0
+
+def trend_analytics(ts_ns: np.ndarray, co2: np.ndarray, pm25: np.ndarray):
+    """(ACH, 30-min PM2.5 forecast) from one shared time axis; either is None if unfit."""
+    t = ts_ns[-ACH_POINTS:]
+    x = (t - t[0]) * 1e-9
+    ach = forecast = None
+    co2 = co2[-ACH_POINTS:]
+    fit = linfit(x, np.log(np.clip(co2 - CO2_BASELINE, 1, None)))
+    if fit is not None:
+        ach = max(0.0, -fit[0] * 3600.0)
+    # the forecast window is a suffix of the ACH one, so its x can be reused as is
+    pm25 = pm25[-FORECAST_POINTS:]
+    fit = linfit(x[-len(pm25):], pm25)
+    if fit is not None:
+        forecast = pm25[-1] + fit[0] * 1800  # 30 minutes
+    return ach, forecast
+
+@st.cache_data(ttl=60, show_spinner=False)
+def make_csv(site, last_ts, n_rows, _df) -> bytes:
+    """CSV export bytes keyed on (site, last ts, row count); the frame itself is not hashed."""
+    return _df.to_csv(index=False).encode("utf-8")
+
+EWMA_SPAN = 30
+
+def _ewma_extend(values: np.ndarray, y_prev: float, alpha: float, gap: int = 0) -> np.ndarray:
+    # plain-float recurrence y = a*x + (1-a)*y; list appends beat ndarray item writes.
+    # NaNs repeat the previous value but still decay its weight, matching the default
+    # ewm(adjust=False, ignore_na=False); `gap` is the NaN run already behind y_prev
+    out = []
+    append = out.append
+    beta = 1 - alpha
+    y, w = y_prev, beta ** gap
+    for x in values.tolist():
+        if x != x:
+            w *= beta
+        elif y != y:
+            y, w = x, 1.0
+        else:
+            w *= beta
+            y = (w * y + alpha * x) / (w + alpha)
+            w = 1.0
+        append(y)
+    return np.array(out, dtype=float)
+
+def ewma_incremental(key, ts_ns: np.ndarray, values: np.ndarray, span: int = EWMA_SPAN) -> np.ndarray:
+    """EWMA (adjust=False) that only walks the rows appended since the previous rerun.
+
+    The last result is kept in session_state under `key`; when the new window starts
+    with the whole previous one, its values are reused and only the tail is computed.
+    Anything else (first run, back-filled rows, a trimmed front) recomputes from scratch,
+    so the result is always ewm(span, adjust=False) over exactly the given window.
+    """
+    alpha = 2 / (span + 1)
+    state = st.session_state.get(key)
+    if state is not None:
+        prev_ts, prev_y = state
+        p = len(prev_ts) - 1
+        # a dropped front row would still be baked into every reused value
+        if 0 <= p < len(ts_ns) and np.array_equal(prev_ts, ts_ns[:p + 1]):
+            valid = np.flatnonzero(~np.isnan(values[:p + 1]))
+            gap = p - int(valid[-1]) if len(valid) else 0
+            y = np.concatenate([prev_y, _ewma_extend(values[p + 1:], prev_y[-1], alpha, gap)])
+            st.session_state[key] = (ts_ns, y)
+            return y
+    y = _ewma_extend(values, np.nan, alpha)
+    st.session_state[key] = (ts_ns, y)
+    return y
+
+@st.cache_resource(show_spinner=False)
+def trend_skeleton(site: str, y_cols: tuple, ewma_cols: tuple, gl: bool) -> dict:
+    """Layout and per-trace styling of the trend chart, built once per shape.
+
+    Only x/y and the action bands change between ticks, so build_trend_figure fills
+    those into shallow copies instead of re-validating a whole go.Figure. Shared and
+    read-only: callers must not mutate it.
+    """
+    trace = go.Scattergl if gl else go.Scatter
+    fig = go.Figure()
+    for c in y_cols:
+        fig.add_trace(trace(mode="lines", name=c))
+    for col in ewma_cols:
+        fig.add_trace(trace(mode="lines", name=f"{col.upper()} EWMA", line=dict(dash="dot", width=2)))
+    fig.update_layout(title=f"Air Quality Trends - {site}", margin=dict(l=0,r=0,t=40,b=0), hovermode='x unified',
+                      uirevision=site)  # keep zoom/legend state across refreshes
+    return fig.to_dict()
+
+def action_band(x0, x1, color: str, label: str):
+    """Shape + annotation pair equivalent to fig.add_vrect(..., annotation_position="top left")."""
+    shape = {"type": "rect", "xref": "x", "yref": "y domain", "x0": x0, "x1": x1, "y0": 0, "y1": 1,
+             "fillcolor": color, "opacity": 0.25, "line": {"width": 0}}
+    note = {"text": label, "showarrow": False, "xref": "x", "yref": "y domain", "x": x0, "y": 1,
+            "xanchor": "left", "yanchor": "top"}
+    return shape, note
+
+# chart builders: cached on their inputs so unchanged data re-serves the figure dict
+@st.cache_data(ttl=30, show_spinner=False)
+def build_trend_figure(site, last_ts, n_rows, ewma_span, purifier_started, exhaust_started, _df, _ewma):
+    """Trend chart keyed on (site, last ts, row count, EWMA span); the frame and EWMA arrays are not hashed.
+
+    Safe because _ewma is a pure function of the keyed window and ewma_span: callers
+    must pass the span the arrays were computed with.
+    """
+    y_cols = tuple(c for c in ["pm25","co2","temp","rh"] if c in _df.columns)
+    # WebGL only pays off on many points; gate on what is plotted after downsampling,
+    # not the raw row count, since SVG has less fixed overhead on small traces
+    skeleton = trend_skeleton(site, y_cols, tuple(_ewma), min(len(_df), TREND_MAX_POINTS) >= SCATTERGL_MIN_POINTS)
+    ts_values = _df["ts"].to_numpy(dtype="datetime64[ns]")
+    x = ts_values.view(np.int64) * 1e-9
+    # raw series first, then the EWMA overlays (computed on the full series and
+    # downsampled on their own); y goes out as plain lists: plotly.js runs an extra
+    # cleanup pass on typed arrays
+    series = [_df[c].to_numpy(dtype=float) for c in y_cols] + list(_ewma.values())
+    data = []
+    for stub, values in zip(skeleton["data"], series):
+        keep = lttb_downsample(x, values)
+        data.append({**stub, "x": ts_values[keep], "y": values[keep].tolist()})
+    # annotate active periods
+    bands = []
+    if purifier_started is not None:
+        bands.append(action_band(purifier_started, last_ts, "#cce5ff", "Purifier"))
+    if exhaust_started is not None:
+        bands.append(action_band(exhaust_started, last_ts, "#ffe6cc", "Exhaust"))
+    layout = {**skeleton["layout"], "shapes": [b[0] for b in bands], "annotations": [b[1] for b in bands]}
+    return {"data": data, "layout": layout}
+
+def histogram_bar(values: np.ndarray, bins: int, name: str) -> go.Bar:
+    """Pre-binned histogram: ships `bins` bars instead of every raw sample."""
+    counts, edges = np.histogram(values[~np.isnan(values)], bins=bins)
+    return go.Bar(x=(edges[:-1] + edges[1:]) / 2, y=counts, width=np.diff(edges), name=name)
+
+@st.cache_data(ttl=30, show_spinner=False)
+def build_pm25_hist(pm25: np.ndarray) -> dict:
+    # PM2.5 histogram with CPCB zones
+    fig = go.Figure()
+    fig.add_trace(histogram_bar(pm25, 30, 'PM2.5 Distribution'))
+
+    # Add CPCB threshold lines
+    cpcb_thresholds = [(30, 'Good'), (60, 'Satisfactory'), (90, 'Moderate'), (120, 'Poor'), (250, 'Very Poor')]
+    for threshold, label in cpcb_thresholds:
+        fig.add_vline(x=threshold, line_dash="dash", line_color="red", 
+                      annotation_text=label, annotation_position="top")
+
+    fig.update_layout(title="PM2.5 Distribution with CPCB Thresholds", 
+                      xaxis_title="PM2.5 (µg/m³)", yaxis_title="Frequency", bargap=0)
+    return fig.to_dict()
+
+@st.cache_data(ttl=30, show_spinner=False)
+def build_co2_hist(co2: np.ndarray) -> dict:
+    fig = go.Figure()
+    fig.add_trace(histogram_bar(co2, 30, 'CO₂ Distribution'))
+    fig.add_vline(x=1000, line_dash="dash", line_color="orange", 
+                  annotation_text="WHO Limit", annotation_position="top")
+    fig.update_layout(title="CO₂ Distribution", 
+                      xaxis_title="CO₂ (ppm)", yaxis_title="Frequency", bargap=0)
+    return fig.to_dict()
+
+@st.cache_data(ttl=30, show_spinner=False)
+def build_box(values: np.ndarray, name: str, title: str) -> dict:
+    # five-number summary + outliers computed here, so only those reach the browser
+    v = values[~np.isnan(values)]
+    fig = go.Figure()
+    if len(v):
+        q1, median, q3 = np.quantile(v, [0.25, 0.5, 0.75])
+        iqr = q3 - q1
+        inside = v[(v >= q1 - 1.5 * iqr) & (v <= q3 + 1.5 * iqr)]
+        outliers = v[(v < q1 - 1.5 * iqr) | (v > q3 + 1.5 * iqr)]
+        fig.add_trace(go.Box(x=[name], q1=[q1], median=[median], q3=[q3],
+                             lowerfence=[inside.min()], upperfence=[inside.max()], name=name))
+        if len(outliers):
+            fig.add_trace(go.Scattergl(x=[name] * len(outliers), y=outliers, mode="markers",
+                                       name="outliers", showlegend=False))
+    else:
+        # all-NaN column (e.g. a PM2.5-only site): st.plotly_chart rejects a figure with no traces
+        fig.add_trace(go.Box(x=[], name=name))
+    fig.update_layout(title=title, yaxis_title=name)
+    return fig.to_dict()
+
+@st.cache_data(ttl=30, show_spinner=False)
+def build_pm25_co2_scatter(co2: np.ndarray, pm25: np.ndarray, categories: pd.Series) -> dict:
+    # categories stay a Series: object ndarrays would be hashed by pointer
+    fig = go.Figure()
+    cats = categories.to_numpy()
+    for cat in pd.unique(cats):
+        mask = cats == cat
+        fig.add_trace(go.Scattergl(x=co2[mask], y=pm25[mask], mode="markers", name=str(cat),
+                                   marker_color=CPCB_COLORS.get(cat)))
+    # Add manual trendline
     try:
-        params = {"window": window}
-        if site: params["site"] = site
-        return api_get("/exposure", params)
-    except Exception:
-        return {"window":window,"good":0,"satisfactory":0,"moderate":0,"poor":0,"very_poor":0,"severe":0}
+        slope, intercept = linfit(co2, pm25)
+        x_trend = np.linspace(np.nanmin(co2), np.nanmax(co2), 100)
+        fig.add_trace(go.Scattergl(x=x_trend, y=slope * x_trend + intercept, 
+                                   mode='lines', name='Trend',
+                                   line=dict(color='black', dash='dash')))
+    except:
+        pass
+    fig.update_layout(title="PM2.5 vs CO₂ Correlation", xaxis_title="co2", yaxis_title="pm25",
+                      legend_title_text="pm25_category")
+    return fig.to_dict()
+
+@st.cache_data(ttl=30, show_spinner=False)
+def build_temp_rh_scatter(temp: np.ndarray, rh: np.ndarray, pm25: np.ndarray) -> dict:
+    fig = go.Figure(go.Scattergl(x=temp, y=rh, mode="markers",
+                                 marker=dict(color=pm25, colorscale='RdYlGn_r', showscale=True,
+                                             colorbar=dict(title="pm25"))))
+    fig.update_layout(title="Temperature vs Humidity", xaxis_title="temp", yaxis_title="rh")
+    return fig.to_dict()
+
+@st.cache_data(ttl=30, show_spinner=False)
+def build_corr_heatmap(values: np.ndarray, cols: tuple) -> dict:
+    corr = pd.DataFrame(values, columns=list(cols)).corr().to_numpy()
+    labels = list(cols)
+    fig = go.Figure(go.Heatmap(z=corr, x=labels, y=labels, text=corr.round(2),
+                               texttemplate="%{text}", colorscale="RdBu_r"))
+    fig.update_layout(title="Parameter Correlation Matrix", yaxis_autorange="reversed")
+    return fig.to_dict()
+
+def build_gauges(pm25, co2, comfort):
+    """PM2.5, CO₂ and comfort gauge figure dicts for the Real-time tab."""
+    fig_gauge_pm25 = go.Figure(go.Indicator(
+        mode="gauge+number+delta",
+        value=pm25,
+        domain={'x': [0, 1], 'y': [0, 1]},
+        title={'text': "PM2.5 (µg/m³)"},
+        delta={'reference': 30},
+        gauge={
+            'axis': {'range': [None, 350]},
+            'bar': {'color': "darkblue"},
+            'steps': [
+                {'range': [0, 30], 'color': "#009865"},
+                {'range': [30, 60], 'color': "#98CE00"},
+                {'range': [60, 90], 'color': "#FFFF00"},
+                {'range': [90, 120], 'color': "#FF7E00"},
+                {'range': [120, 250], 'color': "#FF0000"},
+                {'range': [250, 350], 'color': "#7E0023"}
+            ],
+            'threshold': {'line': {'color': "red", 'width': 4}, 'thickness': 0.75, 'value': 120}
+        }
+    ))
+    fig_gauge_co2 = go.Figure(go.Indicator(
+        mode="gauge+number+delta",
+        value=co2,
+        domain={'x': [0, 1], 'y': [0, 1]},
+        title={'text': "CO₂ (ppm)"},
+        delta={'reference': 1000},
+        gauge={
+            'axis': {'range': [None, 2000]},
+            'bar': {'color': "darkgreen"},
+            'steps': [
+                {'range': [0, 800], 'color': "lightgreen"},
+                {'range': [800, 1000], 'color': "yellow"},
+                {'range': [1000, 2000], 'color': "red"}
+            ],
+            'threshold': {'line': {'color': "red", 'width': 4}, 'thickness': 0.75, 'value': 1000}
+        }
+    ))
+    fig_gauge_comfort = go.Figure(go.Indicator(
+        mode="gauge+number",
+        value=comfort,
+        domain={'x': [0, 1], 'y': [0, 1]},
+        title={'text': "Comfort Index"},
+        gauge={
+            'axis': {'range': [10, 45]},
+            'bar': {'color': "purple"},
+            'steps': [
+                {'range': [10, 20], 'color': "lightblue"},
+                {'range': [20, 30], 'color': "lightgreen"},
+                {'range': [30, 40], 'color': "orange"},
+                {'range': [40, 45], 'color': "red"}
+            ]
+        }
+    ))
+    return fig_gauge_pm25.to_dict(), fig_gauge_co2.to_dict(), fig_gauge_comfort.to_dict()
+
+def memo_figure(name, key, build):
+    """Re-serve a figure dict from session_state while its data key is unchanged.
+
+    Skips both the Plotly build and the cache_data unpickle on refresh ticks where
+    no new reading arrived.
+    """
+    slot = st.session_state.get(f"fig_{name}")
+    if slot is not None and slot[0] == key:
+        return slot[1]
+    fig = build()
+    st.session_state[f"fig_{name}"] = (key, fig)
+    return fig
 
 # health + site controls
-top_col1, top_col2, top_col3, top_col4 = st.columns([2,2,2,2])
+top_col1, top_col2, top_col3 = st.columns([2,4,2])
 api_ok = True
 health = {"count": 0, "last": None}
 try:
     health = api_get("/")
 except Exception:
     api_ok = False
-    if _EMBED_ON_FAIL:
-        _spawn_embedded_api()
-        try:
-            health = api_get("/")
-            api_ok = True
-        except Exception:
-            api_ok = False
 mode = "Embedded" if st.session_state.get("use_local_api", False) else ("API" if api_ok else "Offline")
 if mode == "API":
     top_col1.markdown(f"**Data source:** API | `{API}`")
@@ -202,29 +443,39 @@ else:
         top_col1.caption(f"Backend error: {err}")
 
 if api_ok:
+    sync_caches(health)
+
+@st.fragment(run_every=REFRESH_SECONDS)
+def live_health():
+    """Record count and last-update tiles, refreshed independently of the page."""
+    try:
+        health = api_get("/")
+        sync_caches(health)
+    except Exception:
+        st.warning("API offline — use Seed")
+        return
+    h1, h2 = st.columns(2)
     total_records = health.get('count', 0)
-    top_col2.metric("Total Records", f"{total_records:,}", help="Total sensor readings stored in database")
+    h1.metric("Total Records", f"{total_records:,}", help="Total sensor readings stored in database")
     last = health.get("last")
     if last:
         try:
-            last_dt = pd.to_datetime(last)
-            time_ago = (pd.Timestamp.utcnow() - last_dt).total_seconds()
-            if time_ago < 60:
-                last_display = f"{time_ago:.0f}s ago"
-            elif time_ago < 3600:
-                last_display = f"{time_ago/60:.0f}m ago"
-            else:
-                last_display = f"{time_ago/3600:.1f}h ago"
-            top_col3.metric("Last Update", last_display, help=f"Latest reading: {last}")
+            # one stored isoformat() string: fromisoformat is exact and far cheaper than to_datetime
+            time_ago = time.time() - datetime.fromisoformat(last).timestamp()
+            h2.metric("Last Update", fmt_age(time_ago), help=f"Latest reading: {last}")
         except:
-            top_col3.metric("Last Update", last if last else "—")
+            h2.metric("Last Update", last if last else "—")
     else:
-        top_col3.metric("Last Update", "—")
-else:
-    top_col2.warning("API offline — use Seed")
+        h2.metric("Last Update", "—")
 
 sites = get_sites() if api_ok else ["Lab","Classroom","Canteen"]
-site = top_col4.selectbox("Site", sites, index=0)
+site = top_col3.selectbox("Site", sites, index=0)
+
+if api_ok:
+    with top_col2:
+        live_health()
+else:
+    top_col2.warning("API offline — use Seed")
 
 # seeding / reset controls
 with st.expander("Demo controls (seed/reset)", expanded=not api_ok):
@@ -239,7 +490,7 @@ with st.expander("Demo controls (seed/reset)", expanded=not api_ok):
         try:
             res = api_post("/seed", {"hours": hours, "site": site, "period_seconds": 60})
             st.success(f"Seeded {res.get('seeded', 0)} points for {res.get('site', site)}")
-            get_readings.clear(); get_exposure.clear(); get_sites.clear()
+            clear_data_caches()
             st.rerun()
         except Exception as e:
             st.error(f"Seeding failed: {e}")
@@ -248,7 +499,7 @@ with st.expander("Demo controls (seed/reset)", expanded=not api_ok):
             for s in ["Lab", "Classroom", "Canteen"]:
                 api_post("/seed", {"hours": hours, "site": s, "period_seconds": 60})
             st.success(f"Seeded {hours}h for all sites")
-            get_readings.clear(); get_exposure.clear(); get_sites.clear()
+            clear_data_caches()
             st.rerun()
         except Exception as e:
             st.error(f"Seeding failed: {e}")
@@ -269,7 +520,7 @@ with st.expander("Demo controls (seed/reset)", expanded=not api_ok):
             for s, h, period in sites_config:
                 api_post("/seed", {"hours": h, "site": s, "period_seconds": period})
             st.success(f"Seeded variety pack: 9 sites with different patterns")
-            get_readings.clear(); get_exposure.clear(); get_sites.clear()
+            clear_data_caches()
             st.rerun()
         except Exception as e:
             st.error(f"Seeding failed: {e}")
@@ -277,284 +528,184 @@ with st.expander("Demo controls (seed/reset)", expanded=not api_ok):
         try:
             api_post("/reset", {"site": site})
             st.success(f"Cleared {site}")
-            get_readings.clear(); get_exposure.clear()
+            clear_data_caches()
         except Exception:
             st.error("Reset failed")
     if not api_ok:
         st.caption("Backend API is offline — start it: uvicorn backend.main:app --reload --port 8000")
 
-colA, colB, colC, colD, colE, colF = st.columns(6)
+@st.fragment(run_every=REFRESH_SECONDS)
+def live_section(site: str, api_ok: bool):
+    """Latest metrics, status, trend chart and gauges; reruns every REFRESH_SECONDS."""
+    colA, colB, colC, colD, colE, colF = st.columns(6)
+
+    if api_ok:
+        sync_caches()
+    df = live_readings(site) if api_ok else pd.DataFrame()
+    if not df.empty:
+        latest = df.iloc[-1].to_dict()  # plain dict: O(1) lookups, no Series label dispatch
+        # all age/rate math below runs on int64 ns, seconds only for display
+        ts_ns = ts_nanos(df["ts"])
+        age_s = (time.time_ns() - int(ts_ns[-1])) / 1e9
+
+        # Get CPCB category and color
+        pm25_val = latest.get('pm25', np.nan)
+        pm25_cat = latest.get('pm25_category', 'Unknown')
+        pm25_icon = CATEGORY_ICONS.get(pm25_cat, "⚪")
+
+        colA.metric("PM2.5 (µg/m³)", f"{pm25_val:.1f}", delta=f"{pm25_cat} {pm25_icon}")
+        colB.metric("CO₂ (ppm)", f"{latest.get('co2',np.nan):.0f}")
+        colC.metric("Temperature (°C)", f"{latest.get('temp',np.nan):.1f}")
+        colD.metric("Humidity (%)", f"{latest.get('rh',np.nan):.0f}")
+
+        # simple thermal comfort (humidex-like)
+        try:
+            T = float(latest.get('temp', np.nan))
+            RH = float(latest.get('rh', np.nan))
+            e = 6.112*np.exp((17.67*T)/(T+243.5))*RH/100.0
+            humidex = T + (5/9)*(e-10)
+            colE.metric("Comfort index", f"{humidex:.1f}")
+        except Exception:
+            pass
+
+        # Data freshness indicator
+        try:
+            light = "🟢" if age_s < 60 else "🟡" if age_s < 300 else "🔴"
+            colF.metric("Data Age", f"{light} {fmt_age(age_s)}")
+        except Exception:
+            pass
+    else:
+        st.info("No data yet. Start API then use Seed demo data or Manual Ingest.")
 
-df = get_readings(site=site, window="24h") if api_ok else pd.DataFrame()
-if not df.empty:
-    df["ts"] = pd.to_datetime(df["ts"]) 
-    latest = df.iloc[-1]
-    
-    # Get CPCB category and color
-    pm25_val = latest.get('pm25', np.nan)
-    pm25_cat = latest.get('pm25_category', 'Unknown')
-    cat_colors = {
-        "Good": "🟢", "Satisfactory": "🟡", "Moderately Polluted": "🟠",
-        "Poor": "🔴", "Very Poor": "🟣", "Severe": "🟤"
-    }
-    pm25_icon = cat_colors.get(pm25_cat, "⚪")
-    
-    colA.metric("PM2.5 (µg/m³)", f"{pm25_val:.1f}", delta=f"{pm25_cat} {pm25_icon}")
-    colB.metric("CO₂ (ppm)", f"{latest.get('co2',np.nan):.0f}")
-    colC.metric("Temperature (°C)", f"{latest.get('temp',np.nan):.1f}")
-    colD.metric("Humidity (%)", f"{latest.get('rh',np.nan):.0f}")
-    
-    # simple thermal comfort (humidex-like)
-    try:
-        T = float(latest.get('temp', np.nan))
-        RH = float(latest.get('rh', np.nan))
-        e = 6.112*np.exp((17.67*T)/(T+243.5))*RH/100.0
-        humidex = T + (5/9)*(e-10)
-        colE.metric("Comfort index", f"{humidex:.1f}")
-    except Exception:
-        pass
-    
-    # Data freshness indicator
-    try:
-        time_diff = (pd.Timestamp.utcnow() - df["ts"].iloc[-1]).total_seconds()
-        if time_diff < 60:
-            freshness = f"🟢 {time_diff:.0f}s ago"
-        elif time_diff < 300:
-            freshness = f"🟡 {time_diff/60:.0f}m ago"
-        else:
-            freshness = f"🔴 {time_diff/60:.0f}m ago"
-        colF.metric("Data Age", freshness)
-    except Exception:
-        pass
-else:
-    st.info("No data yet. Start API then use Seed demo data or Manual Ingest.")
+    # ingestion/quality status
+    if not df.empty:
+        st.subheader("Status")
+        try:
+            if len(df) > 60:
+                rate = max(0.0, 60 / (int(ts_ns[-1] - ts_ns[-60]) / 60e9))
+            else:
+                rate = len(df) / max(1, int(ts_ns[-1] - ts_ns[0]) / 60e9)
+            s1, s2 = st.columns(2)
+            s1.metric("Ingestion delay", f"{age_s:.0f}s")
+            s2.metric("Throughput", f"{rate:.1f} pts/min")
+        except Exception:
+            pass
 
-# ingestion/quality status
-if not df.empty:
-    st.subheader("Status")
-    try:
-        age = (pd.Timestamp.utcnow() - df["ts"].iloc[-1]).total_seconds()
-        rate = max(0.0, len(df.tail(60)) / ((df["ts"].iloc[-1] - df["ts"].iloc[-60]).total_seconds()/60.0)) if len(df) > 60 else len(df) / max(1, (df["ts"].iloc[-1] - df["ts"].iloc[0]).total_seconds()/60.0)
-        s1, s2 = st.columns(2)
-        s1.metric("Ingestion delay", f"{age:.0f}s")
-        s2.metric("Throughput", f"{rate:.1f} pts/min")
-    except Exception:
-        pass
+    st.subheader("Trends & Analytics")
+    if not df.empty:
+        # EWMA bands: standalone arrays, the (session/cache-held) frame is never written to
+        ewma = {col: ewma_incremental(("ewma", site, col), ts_ns, df[col].to_numpy(dtype=float), EWMA_SPAN)
+                for col in ["pm25","co2"] if col in df}
+
+        # figures below are only rebuilt when this changes
+        fig_key = (site, df["ts"].iloc[-1], len(df))
+
+        # Tabs for different visualizations
+        tab_trend, tab_gauges = st.tabs(["📈 Time Series", "⚡ Real-time"])
+
+        with tab_trend:
+            # control simulation toggles (visual only)
+            with st.expander("Simulate actions (visual only)"):
+                a1, a2 = st.columns(2)
+                if a1.toggle("Air purifier active", key="purifier_toggle", value=False):
+                    if "purifier_started" not in st.session_state:
+                        st.session_state["purifier_started"] = df["ts"].iloc[-1]
+                else:
+                    st.session_state.pop("purifier_started", None)
+                if a2.toggle("Exhaust fan active", key="exhaust_toggle", value=False):
+                    if "exhaust_started" not in st.session_state:
+                        st.session_state["exhaust_started"] = df["ts"].iloc[-1]
+                else:
+                    st.session_state.pop("exhaust_started", None)
+
+            purifier_started = st.session_state.get("purifier_started")
+            exhaust_started = st.session_state.get("exhaust_started")
+            fig = memo_figure("trend", fig_key + (EWMA_SPAN, purifier_started, exhaust_started),
+                              lambda: build_trend_figure(site, df["ts"].iloc[-1], len(df), EWMA_SPAN,
+                                                         purifier_started, exhaust_started, df, ewma))
+            st.plotly_chart(fig, use_container_width=True)
+
+        with tab_gauges:
+            # Real-time gauges
+            gauge_col1, gauge_col2, gauge_col3 = st.columns(3)
+            comfort = humidex if 'humidex' in locals() else 25
+            co2_val = latest.get('co2', 0)
+            fig_gauge_pm25, fig_gauge_co2, fig_gauge_comfort = memo_figure(
+                "gauges", fig_key, lambda: build_gauges(pm25_val, co2_val, comfort))
+
+            with gauge_col1:
+                st.plotly_chart(fig_gauge_pm25, use_container_width=True)
+
+            with gauge_col2:
+                st.plotly_chart(fig_gauge_co2, use_container_width=True)
+
+            with gauge_col3:
+                st.plotly_chart(fig_gauge_comfort, use_container_width=True)
+
+        # lightweight analytics: ACH estimate & 30m forecast
+        met1, met2 = st.columns(2)
+        try:
+            ach, forecast = memo_figure("analytics", fig_key, lambda: trend_analytics(
+                ts_ns[-ACH_POINTS:],
+                df["co2"].tail(ACH_POINTS).to_numpy(dtype=float),
+                df["pm25"].tail(FORECAST_POINTS).to_numpy(dtype=float)))
+            if ach is not None:
+                met1.metric("Ventilation rate (ACH)", f"{ach:.2f}", help="Estimated from CO₂ decay")
+            if forecast is not None:
+                met2.metric("PM2.5 forecast (30m)", f"{forecast:.1f} µg/m³")
+        except Exception:
+            pass
+
+live_section(site, api_ok)
 
-st.subheader("Trends & Analytics")
+# non-live sections below render once per user interaction
+df = get_readings(site=site) if api_ok else pd.DataFrame()
 if not df.empty:
-    # EWMA bands
-    for col in ["pm25","co2"]:
-        if col in df:
-            df[f"{col}_ewma"] = df[col].ewm(span=30, adjust=False).mean()
-    
-    # Tabs for different visualizations
-    tab1, tab2, tab3, tab4 = st.tabs(["📈 Time Series", "📊 Distributions", "🎯 Correlations", "⚡ Real-time"])
-    
-    with tab1:
-        # control simulation toggles (visual only)
-        with st.expander("Simulate actions (visual only)"):
-            a1, a2 = st.columns(2)
-            if a1.toggle("Air purifier active", key="purifier_toggle", value=False):
-                if "purifier_started" not in st.session_state:
-                    st.session_state["purifier_started"] = df["ts"].iloc[-1]
-            else:
-                st.session_state.pop("purifier_started", None)
-            if a2.toggle("Exhaust fan active", key="exhaust_toggle", value=False):
-                if "exhaust_started" not in st.session_state:
-                    st.session_state["exhaust_started"] = df["ts"].iloc[-1]
-            else:
-                st.session_state.pop("exhaust_started", None)
-
-        y_cols = [c for c in ["pm25","co2","temp","rh"] if c in df.columns]
-        fig = px.line(df, x="ts", y=y_cols, title=f"Air Quality Trends - {site}")
-        # overlay EWMA lines
-        for col in ["pm25","co2"]:
-            if f"{col}_ewma" in df:
-                fig.add_trace(go.Scatter(x=df["ts"], y=df[f"{col}_ewma"], name=f"{col.upper()} EWMA", line=dict(dash="dot", width=2)))
-        # annotate active periods
-        now_ts = df["ts"].iloc[-1]
-        if "purifier_started" in st.session_state:
-            fig.add_vrect(x0=st.session_state["purifier_started"], x1=now_ts, fillcolor="#cce5ff", opacity=0.25, line_width=0, annotation_text="Purifier", annotation_position="top left")
-        if "exhaust_started" in st.session_state:
-            fig.add_vrect(x0=st.session_state["exhaust_started"], x1=now_ts, fillcolor="#ffe6cc", opacity=0.25, line_width=0, annotation_text="Exhaust", annotation_position="top left")
-
-        fig.update_layout(margin=dict(l=0,r=0,t=40,b=0), hovermode='x unified')
-        st.plotly_chart(fig, use_container_width=True)
-    
-    with tab2:
+    tab_dist, tab_corr = st.tabs(["📊 Distributions", "🎯 Correlations"])
+
+    with tab_dist:
         # Distribution charts
         dist_col1, dist_col2 = st.columns(2)
-        
+
         with dist_col1:
-            # PM2.5 histogram with CPCB zones
-            fig_pm25_hist = go.Figure()
-            fig_pm25_hist.add_trace(go.Histogram(x=df['pm25'], nbinsx=30, name='PM2.5 Distribution'))
-            
-            # Add CPCB threshold lines
-            cpcb_thresholds = [(30, 'Good'), (60, 'Satisfactory'), (90, 'Moderate'), (120, 'Poor'), (250, 'Very Poor')]
-            for threshold, label in cpcb_thresholds:
-                fig_pm25_hist.add_vline(x=threshold, line_dash="dash", line_color="red", 
-                                        annotation_text=label, annotation_position="top")
-            
-            fig_pm25_hist.update_layout(title="PM2.5 Distribution with CPCB Thresholds", 
-                                        xaxis_title="PM2.5 (µg/m³)", yaxis_title="Frequency")
-            st.plotly_chart(fig_pm25_hist, use_container_width=True)
-        
+            st.plotly_chart(build_pm25_hist(df['pm25'].to_numpy(dtype=float)), use_container_width=True)
+
         with dist_col2:
-            # CO2 histogram
-            fig_co2_hist = go.Figure()
-            fig_co2_hist.add_trace(go.Histogram(x=df['co2'], nbinsx=30, name='CO₂ Distribution'))
-            fig_co2_hist.add_vline(x=1000, line_dash="dash", line_color="orange", 
-                                   annotation_text="WHO Limit", annotation_position="top")
-            fig_co2_hist.update_layout(title="CO₂ Distribution", 
-                                       xaxis_title="CO₂ (ppm)", yaxis_title="Frequency")
-            st.plotly_chart(fig_co2_hist, use_container_width=True)
-        
+            st.plotly_chart(build_co2_hist(df['co2'].to_numpy(dtype=float)), use_container_width=True)
+
         # Box plots
         box_col1, box_col2 = st.columns(2)
         with box_col1:
-            fig_box_pm25 = px.box(df, y='pm25', title="PM2.5 Box Plot", points="outliers")
-            st.plotly_chart(fig_box_pm25, use_container_width=True)
-        
+            st.plotly_chart(build_box(df['pm25'].to_numpy(dtype=float), "pm25", "PM2.5 Box Plot"), use_container_width=True)
+
         with box_col2:
-            fig_box_co2 = px.box(df, y='co2', title="CO₂ Box Plot", points="outliers")
-            st.plotly_chart(fig_box_co2, use_container_width=True)
-    
-    with tab3:
+            st.plotly_chart(build_box(df['co2'].to_numpy(dtype=float), "co2", "CO₂ Box Plot"), use_container_width=True)
+
+    with tab_corr:
         # Correlation analysis
         corr_col1, corr_col2 = st.columns(2)
-        
+
         with corr_col1:
             # Scatter: PM2.5 vs CO2
-            fig_scatter1 = px.scatter(df, x='co2', y='pm25', color='pm25_category',
-                                     color_discrete_map=CPCB_COLORS,
-                                     title="PM2.5 vs CO₂ Correlation")
-            # Add manual trendline
-            try:
-                z = np.polyfit(df['co2'].astype(float), df['pm25'].astype(float), 1)
-                p = np.poly1d(z)
-                x_trend = np.linspace(df['co2'].min(), df['co2'].max(), 100)
-                fig_scatter1.add_trace(go.Scatter(x=x_trend, y=p(x_trend), 
-                                                  mode='lines', name='Trend',
-                                                  line=dict(color='black', dash='dash')))
-            except:
-                pass
-            st.plotly_chart(fig_scatter1, use_container_width=True)
-        
+            st.plotly_chart(build_pm25_co2_scatter(df['co2'].to_numpy(dtype=float), df['pm25'].to_numpy(dtype=float),
+                                                   df['pm25_category']), use_container_width=True)
+
         with corr_col2:
             # Scatter: Temperature vs Humidity
-            fig_scatter2 = px.scatter(df, x='temp', y='rh', color='pm25',
-                                     title="Temperature vs Humidity",
-                                     color_continuous_scale='RdYlGn_r')
-            st.plotly_chart(fig_scatter2, use_container_width=True)
-        
+            st.plotly_chart(build_temp_rh_scatter(df['temp'].to_numpy(dtype=float), df['rh'].to_numpy(dtype=float),
+                                                  df['pm25'].to_numpy(dtype=float)), use_container_width=True)
+
         # Correlation heatmap
-        corr_data = df[['pm25', 'co2', 'temp', 'rh']].corr()
-        fig_heatmap = px.imshow(corr_data, text_auto=True, aspect="auto",
-                                title="Parameter Correlation Matrix",
-                                color_continuous_scale='RdBu_r')
-        st.plotly_chart(fig_heatmap, use_container_width=True)
-    
-    with tab4:
-        # Real-time gauges
-        gauge_col1, gauge_col2, gauge_col3 = st.columns(3)
-        
-        with gauge_col1:
-            fig_gauge_pm25 = go.Figure(go.Indicator(
-                mode="gauge+number+delta",
-                value=pm25_val,
-                domain={'x': [0, 1], 'y': [0, 1]},
-                title={'text': "PM2.5 (µg/m³)"},
-                delta={'reference': 30},
-                gauge={
-                    'axis': {'range': [None, 350]},
-                    'bar': {'color': "darkblue"},
-                    'steps': [
-                        {'range': [0, 30], 'color': "#009865"},
-                        {'range': [30, 60], 'color': "#98CE00"},
-                        {'range': [60, 90], 'color': "#FFFF00"},
-                        {'range': [90, 120], 'color': "#FF7E00"},
-                        {'range': [120, 250], 'color': "#FF0000"},
-                        {'range': [250, 350], 'color': "#7E0023"}
-                    ],
-                    'threshold': {'line': {'color': "red", 'width': 4}, 'thickness': 0.75, 'value': 120}
-                }
-            ))
-            st.plotly_chart(fig_gauge_pm25, use_container_width=True)
-        
-        with gauge_col2:
-            fig_gauge_co2 = go.Figure(go.Indicator(
-                mode="gauge+number+delta",
-                value=latest.get('co2', 0),
-                domain={'x': [0, 1], 'y': [0, 1]},
-                title={'text': "CO₂ (ppm)"},
-                delta={'reference': 1000},
-                gauge={
-                    'axis': {'range': [None, 2000]},
-                    'bar': {'color': "darkgreen"},
-                    'steps': [
-                        {'range': [0, 800], 'color': "lightgreen"},
-                        {'range': [800, 1000], 'color': "yellow"},
-                        {'range': [1000, 2000], 'color': "red"}
-                    ],
-                    'threshold': {'line': {'color': "red", 'width': 4}, 'thickness': 0.75, 'value': 1000}
-                }
-            ))
-            st.plotly_chart(fig_gauge_co2, use_container_width=True)
-        
-        with gauge_col3:
-            fig_gauge_comfort = go.Figure(go.Indicator(
-                mode="gauge+number",
-                value=humidex if 'humidex' in locals() else 25,
-                domain={'x': [0, 1], 'y': [0, 1]},
-                title={'text': "Comfort Index"},
-                gauge={
-                    'axis': {'range': [10, 45]},
-                    'bar': {'color': "purple"},
-                    'steps': [
-                        {'range': [10, 20], 'color': "lightblue"},
-                        {'range': [20, 30], 'color': "lightgreen"},
-                        {'range': [30, 40], 'color': "orange"},
-                        {'range': [40, 45], 'color': "red"}
-                    ]
-                }
-            ))
-            st.plotly_chart(fig_gauge_comfort, use_container_width=True)
-
-    # lightweight analytics: ACH estimate & 30m forecast
-    met1, met2 = st.columns(2)
-    if "co2" in df and df["co2"].notna().any():
-        try:
-            sub = df.tail(180)  # about last 3 hours if 1-min cadence; safe if denser too
-            x = (sub["ts"] - sub["ts"].iloc[0]).dt.total_seconds().values
-            co2 = sub["co2"].astype(float).values
-            baseline = 400.0
-            y = np.log(np.clip(co2 - baseline, 1, None))
-            slope, intercept = np.polyfit(x, y, 1)
-            ach = max(0.0, -slope * 3600.0)
-            met1.metric("Ventilation rate (ACH)", f"{ach:.2f}", help="Estimated from CO₂ decay")
-        except Exception:
-            pass
-    if "pm25" in df and df["pm25"].notna().any():
-        try:
-            sub = df.tail(60)
-            x = (sub["ts"] - sub["ts"].iloc[0]).dt.total_seconds().values
-            y = sub["pm25"].astype(float).values
-            slope, intercept = np.polyfit(x, y, 1)
-            forecast = y[-1] + slope * 1800  # 30 minutes
-            met2.metric("PM2.5 forecast (30m)", f"{forecast:.1f} µg/m³")
-        except Exception:
-            pass
+        corr_cols = ('pm25', 'co2', 'temp', 'rh')
+        st.plotly_chart(build_corr_heatmap(df[list(corr_cols)].to_numpy(dtype=float), corr_cols), use_container_width=True)
 
 st.subheader("CPCB Exposure (time in zone)")
 win = st.selectbox("Window", ["24h","7d"], index=0)
 exp = get_exposure(win, site=site)
-exp_data = pd.DataFrame({
-    "Category":["Good","Satisfactory","Moderately Polluted","Poor","Very Poor","Severe"],
-    "Minutes":[exp.get("good",0),exp.get("satisfactory",0),exp.get("moderate",0),exp.get("poor",0),exp.get("very_poor",0),exp.get("severe",0)]
-})
-fig2 = px.bar(exp_data, x="Category", y="Minutes", color="Category", color_discrete_map=CPCB_COLORS)
+exp_cats = ["Good","Satisfactory","Moderately Polluted","Poor","Very Poor","Severe"]
+exp_mins = [exp.get("good",0),exp.get("satisfactory",0),exp.get("moderate",0),exp.get("poor",0),exp.get("very_poor",0),exp.get("severe",0)]
+fig2 = go.Figure(go.Bar(x=exp_cats, y=exp_mins, marker_color=[CPCB_COLORS[c] for c in exp_cats]))
+fig2.update_layout(xaxis_title="Category", yaxis_title="Minutes")
 fig2.update_layout(margin=dict(l=0,r=0,t=24,b=0))
 st.plotly_chart(fig2, use_container_width=True)
 
@@ -570,14 +721,14 @@ with st.form("ingest"):
         try:
             api_post("/ingest", {"pm25":pm25,"co2":co2,"temp":temp,"rh":rh, "site": site, "source": "manual"})
             st.success("Reading saved")
-            get_readings.clear(); get_exposure.clear()
+            clear_data_caches()
         except Exception:
             st.error("API not reachable")
 
 st.subheader("Alert log")
 if api_ok:
     try:
-        events = api_get("/events", {"site": site, "limit": 50})
+        events = get_dashboard(site)["events"]
         if events:
             st.dataframe(pd.DataFrame(events))
         else:
@@ -589,16 +740,21 @@ if api_ok:
 if not df.empty:
     st.subheader("Statistical Summary")
     stat_cols = st.columns(4)
-    
+    try:
+        # aggregated in SQLite and shipped with the /dashboard bundle
+        stats = get_dashboard(site)["summary"]
+    except Exception:
+        stats = {}
+
     for idx, param in enumerate(['pm25', 'co2', 'temp', 'rh']):
-        if param in df.columns:
+        p = stats.get(param) or {}
+        if p.get("min") is not None:
             with stat_cols[idx]:
-                param_data = df[param].astype(float)
                 st.markdown(f"**{param.upper()}**")
-                st.write(f"Min: {param_data.min():.1f}")
-                st.write(f"Mean: {param_data.mean():.1f}")
-                st.write(f"Max: {param_data.max():.1f}")
-                st.write(f"Std: {param_data.std():.1f}")
+                st.write(f"Min: {p['min']:.1f}")
+                st.write(f"Mean: {p['mean']:.1f}")
+                st.write(f"Max: {p['max']:.1f}")
+                st.write(f"Std: {p['std']:.1f}" if p["std"] is not None else "Std: —")
 
 # Site Comparison
 if api_ok:
@@ -607,19 +763,17 @@ if api_ok:
         all_sites = get_sites()
         if len(all_sites) > 1:
             comparison_data = []
-            for s in all_sites:
-                site_df = get_readings(site=s, window="24h")
-                if not site_df.empty:
-                    site_df["ts"] = pd.to_datetime(site_df["ts"])
-                    latest_site = site_df.iloc[-1]
-                    comparison_data.append({
-                        "Site": s,
-                        "PM2.5": latest_site.get('pm25', 0),
-                        "CO2": latest_site.get('co2', 0),
-                        "Temp": latest_site.get('temp', 0),
-                        "Humidity": latest_site.get('rh', 0),
-                        "Category": latest_site.get('pm25_category', 'Unknown')
-                    })
+            for latest_site in get_dashboard(site)["latest"]:
+                if latest_site.get('site') not in all_sites:
+                    continue
+                comparison_data.append({
+                    "Site": latest_site.get('site'),
+                    "PM2.5": latest_site.get('pm25') or 0,
+                    "CO2": latest_site.get('co2') or 0,
+                    "Temp": latest_site.get('temp') or 0,
+                    "Humidity": latest_site.get('rh') or 0,
+                    "Category": latest_site.get('pm25_category') or 'Unknown'
+                })
             
             if comparison_data:
                 comp_df = pd.DataFrame(comparison_data)
@@ -627,25 +781,26 @@ if api_ok:
                 
                 # Comparison charts
                 comp_col1, comp_col2 = st.columns(2)
+                site_names = comp_df["Site"].to_numpy()
                 with comp_col1:
-                    fig_pm25 = px.bar(comp_df, x="Site", y="PM2.5", color="Category",
-                                      color_discrete_map=CPCB_COLORS,
-                                      title="PM2.5 Comparison Across Sites")
+                    categories = comp_df["Category"].to_numpy()
+                    fig_pm25 = go.Figure(go.Bar(x=site_names, y=comp_df["PM2.5"].to_numpy(),
+                                                marker_color=[CPCB_COLORS.get(c, "#999999") for c in categories],
+                                                customdata=categories,
+                                                hovertemplate="%{x}<br>PM2.5: %{y:.1f}<br>%{customdata}<extra></extra>"))
+                    fig_pm25.update_layout(title="PM2.5 Comparison Across Sites", xaxis_title="Site", yaxis_title="PM2.5")
                     st.plotly_chart(fig_pm25, use_container_width=True)
                 
                 with comp_col2:
-                    fig_co2 = px.bar(comp_df, x="Site", y="CO2",
-                                     title="CO₂ Comparison Across Sites")
+                    fig_co2 = go.Figure(go.Bar(x=site_names, y=comp_df["CO2"].to_numpy()))
+                    fig_co2.update_layout(title="CO₂ Comparison Across Sites", xaxis_title="Site", yaxis_title="CO2")
                     st.plotly_chart(fig_co2, use_container_width=True)
     except Exception as e:
         st.caption(f"Comparison unavailable: {e}")
 
 # export
 if not df.empty:
-    csv = df.to_csv(index=False).encode("utf-8")
+    # the CSV is only built when the button is clicked; values are bound now because
+    # the callable runs on its own thread after this rerun has moved on
+    csv = lambda site=site, df=df: make_csv(site, df["ts"].iloc[-1], len(df), df)
     st.download_button("Download CSV", data=csv, file_name=f"iaq_{site}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv", mime="text/csv")
-
-# Auto-refresh trigger
-import time
-time.sleep(5)
-st.rerun()
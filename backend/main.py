@@ -1,18 +1,37 @@
 from datetime import datetime, timedelta, timezone
 from typing import Optional, List, Dict
-from fastapi import FastAPI, Query
-from pydantic import BaseModel, Field
+from fastapi import Depends, FastAPI, Query, Request
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel, Field, field_validator
+import orjson
 import sqlite3
 import os
-import random
+import math
+import time
+from bisect import bisect_left
+from itertools import compress, product, repeat
+from queue import Empty, Full, Queue
+try:
+    import pyarrow as pa
+except ImportError:  # layout=arrow then falls back to the columns layout
+    pa = None
 
 DB_PATH = os.environ.get("IAQ_DB", os.path.join(os.path.dirname(__file__), "iaq.db"))
 
 def get_conn():
-    return sqlite3.connect(DB_PATH, check_same_thread=False)
+    c = sqlite3.connect(DB_PATH, check_same_thread=False)
+    # WAL: readers don't block on the writer and commits append instead of rewriting
+    # the journal; NORMAL only fsyncs at checkpoints, which is fine for telemetry
+    c.execute("PRAGMA journal_mode=WAL")
+    c.execute("PRAGMA synchronous=NORMAL")
+    c.execute("PRAGMA temp_store=MEMORY")
+    c.execute("PRAGMA mmap_size=268435456")
+    c.execute("PRAGMA cache_size=-65536")
+    return c
 
-conn = get_conn()
-cur = conn.cursor()
+# schema setup gets its own connection, which afterwards only answers PRAGMA data_version
+meta_conn = get_conn()
+cur = meta_conn.cursor()
 cur.execute(
     """
     CREATE TABLE IF NOT EXISTS readings (
@@ -42,18 +61,49 @@ cur.execute(
     )
     """
 )
-conn.commit()
+meta_conn.commit()
 
 # Schema migration for missing columns on existing DBs
 def ensure_column(table: str, name: str, type_sql: str):
-    cols = [r[1] for r in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+    cols = [r[1] for r in meta_conn.execute(f"PRAGMA table_info({table})").fetchall()]
     if name not in cols:
-        conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {type_sql}")
-        conn.commit()
+        meta_conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {type_sql}")
+        meta_conn.commit()
 
 ensure_column("readings", "site", "TEXT DEFAULT 'Lab'")
 ensure_column("readings", "source", "TEXT")
 
+# site-filtered windows range-scan these instead of walking the whole table
+meta_conn.execute("CREATE INDEX IF NOT EXISTS idx_readings_site_ts ON readings(site, ts)")
+meta_conn.execute("CREATE INDEX IF NOT EXISTS idx_events_site_ts_id ON events(site, ts DESC, id DESC)")
+meta_conn.commit()
+
+# requests borrow one of a few connections instead of queueing on a single shared one;
+# under WAL the readers don't block each other or the writer
+POOL_SIZE = int(os.environ.get("IAQ_DB_POOL", "4"))
+_pool: Queue = Queue(maxsize=POOL_SIZE)
+for _ in range(POOL_SIZE):
+    _pool.put(get_conn())
+
+def db():
+    # never wait for a pooled connection: this runs on the same threadpool as the
+    # endpoints, so blocking here can park every thread while the holders starve.
+    # a burst past POOL_SIZE gets short-lived overflow connections instead
+    try:
+        c = _pool.get_nowait()
+    except Empty:
+        c = get_conn()
+    try:
+        yield c
+    finally:
+        # never hand the next request a half-done transaction
+        if c.in_transaction:
+            c.rollback()
+        try:
+            _pool.put_nowait(c)
+        except Full:
+            c.close()
+
 # CPCB NAQI mapping for PM2.5
 PM25_BP = [
     (0, 30, 0, 50, "Good", "#009865"),
@@ -64,17 +114,34 @@ PM25_BP = [
     (251, 350, 401, 500, "Severe", "#7E0023"),
 ]
 
+# flat lookup tables: bisect on the upper breakpoints instead of scanning the bands
+_BHI = [b[1] for b in PM25_BP]
+_BLO = [b[0] for b in PM25_BP]
+_ILO = [b[2] for b in PM25_BP]
+_SLOPE = [(Ihi - Ilo) / (Bhi - Blo) for Blo, Bhi, Ilo, Ihi, _, _ in PM25_BP]
+_CAT = [b[4] for b in PM25_BP]
+_CAT_TO_INT = {c: i for i, c in enumerate(_CAT)}
+
 def sub_index_pm25(v: float):
     if v is None:
         return None, None
-    for Blo, Bhi, Ilo, Ihi, cat, _ in PM25_BP:
-        if Blo <= v <= Bhi:
-            I = (Ihi - Ilo) / (Bhi - Blo) * (v - Blo) + Ilo
-            return int(round(I)), cat
-    last = PM25_BP[-1]
-    Blo, Bhi, Ilo, Ihi, cat, _ = last
-    I = (Ihi - Ilo) / (Bhi - Blo) * (v - Blo) + Ihi
-    return int(round(max(I, Ihi))), cat
+    i = bisect_left(_BHI, v)
+    if i == len(_BHI):
+        # above the last band: extrapolate from the top of the scale
+        I = _SLOPE[-1] * (v - _BLO[-1]) + PM25_BP[-1][3]
+        return int(round(I)), _CAT[-1]
+    return int(round(_SLOPE[i] * (v - _BLO[i]) + _ILO[i])), _CAT[i]
+
+def sub_index_pm25_vec(arr):
+    """sub_index_pm25 over a whole array: (index ints, category objects)."""
+    import numpy as np
+    # a seventh slot carries the above-scale extrapolation
+    i = np.searchsorted(_BHI, arr, side="left")
+    blo = np.array(_BLO + _BLO[-1:])[i]
+    ilo = np.array(_ILO + [PM25_BP[-1][3]])[i]
+    slope = np.array(_SLOPE + _SLOPE[-1:])[i]
+    idx = np.rint(slope * (arr - blo) + ilo).astype(np.int64)
+    return idx, np.array(_CAT + _CAT[-1:], dtype=object)[i]
 
 class ReadingIn(BaseModel):
     ts: Optional[datetime] = Field(default_factory=lambda: datetime.now(timezone.utc))
@@ -85,6 +152,18 @@ class ReadingIn(BaseModel):
     site: Optional[str] = Field(default="Lab")
     source: Optional[str] = Field(default=None)
 
+    @field_validator("ts")
+    @classmethod
+    def ts_utc(cls, v: Optional[datetime]):
+        # normalize once at the edge: naive means UTC, everything ends up on timezone.utc
+        if v is None:
+            return datetime.now(timezone.utc)
+        if v.tzinfo is timezone.utc:
+            return v
+        if v.tzinfo is None:
+            return v.replace(tzinfo=timezone.utc)
+        return v.astimezone(timezone.utc)
+
 class ExposureOut(BaseModel):
     window: str
     good: int
@@ -99,121 +178,283 @@ class SeedIn(BaseModel):
     site: str = "Lab"
     period_seconds: int = 60
 
-app = FastAPI(title="IAQ Backend", version="0.2.0")
+class OrjsonResponse(JSONResponse):
+    # orjson renders the list-of-dict payloads several times faster than stdlib json
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+READING_COLS = ["ts", "pm25", "co2", "temp", "rh", "pm25_index", "pm25_category", "site", "source"]
+
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+def arrow_stream(rows) -> bytes:
+    """Readings rows as one Arrow IPC stream, with ts already typed as UTC timestamps."""
+    cols = list(zip(*rows)) if rows else [()] * len(READING_COLS)
+    types = [pa.string(), pa.float64(), pa.float64(), pa.float64(), pa.float64(),
+             pa.int64(), pa.string(), pa.string(), pa.string()]
+    arrays = [pa.array(v, type=t) for v, t in zip(cols, types)]
+    arrays[0] = arrays[0].cast(pa.timestamp("us", tz="UTC"))
+    table = pa.Table.from_arrays(arrays, names=READING_COLS)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+app = FastAPI(title="IAQ Backend", version="0.2.0", default_response_class=OrjsonResponse)
+
+# every GET is a pure function of the DB, so one version tag covers all of them:
+# writes through this app bump _writes, PRAGMA data_version on meta_conn (which never
+# writes) catches commits from the pool and from other processes
+BOOT_ID = os.urandom(4).hex()
+_writes = 0
+
+def data_etag() -> str:
+    dv = meta_conn.execute("PRAGMA data_version").fetchone()[0]
+    return f'W/"{BOOT_ID}-{_writes}-{dv}"'
+
+@app.middleware("http")
+async def conditional_get(request: Request, call_next):
+    global _writes
+    if request.method != "GET":
+        response = await call_next(request)
+        _writes += 1
+        return response
+    # taken before the handler runs, so a write racing it can only make the tag stale-early
+    tag = data_etag()
+    if request.headers.get("if-none-match") == tag:
+        return Response(status_code=304, headers={"ETag": tag})
+    response = await call_next(request)
+    response.headers["ETag"] = tag
+    return response
 
 @app.get("/")
-def root():
+def root(conn: sqlite3.Connection = Depends(db)):
     last = conn.execute("SELECT MAX(ts) FROM readings").fetchone()[0]
     count = conn.execute("SELECT COUNT(*) FROM readings").fetchone()[0]
     return {"ok": True, "db": os.path.abspath(DB_PATH), "last": last, "count": count}
 
 @app.get("/sites")
-def sites() -> List[str]:
+def sites(conn: sqlite3.Connection = Depends(db)) -> List[str]:
+    # no in-process memo: the data-version ETag already turns repeat polls into 304s,
+    # and a memo would let a stale list go out under a fresh tag
     rows = conn.execute("SELECT DISTINCT site FROM readings ORDER BY site").fetchall()
     return [r[0] for r in rows] or ["Lab"]
 
-def insert_reading(r: ReadingIn):
-    ts = r.ts.astimezone(timezone.utc).isoformat()
-    idx, cat = sub_index_pm25(r.pm25) if r.pm25 is not None else (None, None)
-    conn.execute(
-        "INSERT OR REPLACE INTO readings(ts, pm25, co2, temp, rh, pm25_index, pm25_category, site, source) VALUES (?,?,?,?,?,?,?,?,?)",
-        (ts, r.pm25, r.co2, r.temp, r.rh, idx, cat, r.site or "Lab", r.source),
-    )
+# OR IGNORE: a duplicate ts is skipped instead of REPLACE's hidden delete + reinsert
+INSERT_READING_SQL = "INSERT OR IGNORE INTO readings(ts, pm25, co2, temp, rh, pm25_index, pm25_category, site, source) VALUES (?,?,?,?,?,?,?,?,?)"
+UPDATE_READING_SQL = "UPDATE readings SET pm25=?, co2=?, temp=?, rh=?, pm25_index=?, pm25_category=?, site=?, source=? WHERE ts=?"
+INSERT_EVENT_SQL = "INSERT INTO events(ts, site, type, severity, message) VALUES (?,?,?,?,?)"
+
+def reading_rows(ts: datetime, pm25, co2, temp, rh, site: Optional[str], source: Optional[str]):
+    """(readings row, events row or None) for one reading, ready for executemany."""
+    # ReadingIn already hands over timezone.utc datetimes; only other callers need converting
+    ts = ts.isoformat() if ts.tzinfo is timezone.utc else ts.astimezone(timezone.utc).isoformat()
+    site = site or "Lab"
+    idx, cat = sub_index_pm25(pm25) if pm25 is not None else (None, None)
+    return (ts, pm25, co2, temp, rh, idx, cat, site, source), pm25_event(ts, site, pm25, cat)
+
+ALERT_CATS = ("Poor", "Very Poor", "Severe")
+
+def pm25_event(ts: str, site: str, pm25, cat):
     # simple alert log when category Poor or worse
-    if cat in ("Poor", "Very Poor", "Severe"):
-        conn.execute(
-            "INSERT INTO events(ts, site, type, severity, message) VALUES (?,?,?,?,?)",
-            (ts, r.site or "Lab", "pm25_alert", "warning" if cat=="Poor" else "critical", f"PM2.5 is {cat} ({r.pm25:.1f} µg/m³)"),
-        )
-    conn.commit()
-    return ts, idx, cat
+    if cat in ALERT_CATS:
+        return (ts, site, "pm25_alert", "warning" if cat=="Poor" else "critical", f"PM2.5 is {cat} ({pm25:.1f} µg/m³)")
+    return None
+
+def insert_readings_bulk(conn: sqlite3.Connection, rows: List[tuple], events: List[tuple]):
+    # one transaction (and one commit) for the whole batch
+    with conn:
+        if events:
+            # OR IGNORE drops rows whose ts is already stored; like insert_reading, no alert for those
+            lo, hi = min(e[0] for e in events), max(e[0] for e in events)
+            stored = {r[0] for r in conn.execute("SELECT ts FROM readings WHERE ts BETWEEN ? AND ?", (lo, hi))}
+            events = [e for e in events if e[0] not in stored]
+        conn.executemany(INSERT_READING_SQL, rows)
+        if events:
+            conn.executemany(INSERT_EVENT_SQL, events)
+
+def insert_reading(conn: sqlite3.Connection, r: ReadingIn, upsert: bool = False):
+    """Store one reading; a duplicate ts is left alone unless `upsert`.
+
+    Returns (ts, idx, cat, stored); for a skipped duplicate idx/cat are the stored row's.
+    """
+    row, event = reading_rows(r.ts, r.pm25, r.co2, r.temp, r.rh, r.site, r.source)
+    idx, cat = row[5], row[6]
+    with conn:
+        stored = conn.execute(INSERT_READING_SQL, row).rowcount > 0
+        if not stored and upsert:
+            stored = conn.execute(UPDATE_READING_SQL, row[1:] + row[:1]).rowcount > 0
+        if not stored:
+            idx, cat = conn.execute("SELECT pm25_index, pm25_category FROM readings WHERE ts=?", (row[0],)).fetchone()
+        # no alert for a reading that was dropped as a duplicate
+        elif event:
+            conn.execute(INSERT_EVENT_SQL, event)
+    return row[0], idx, cat, stored
 
 @app.post("/ingest")
-def ingest(r: ReadingIn):
-    ts, idx, cat = insert_reading(r)
-    return {"inserted": ts, "pm25_index": idx, "pm25_category": cat}
+def ingest(r: ReadingIn, upsert: bool = False, conn: sqlite3.Connection = Depends(db)):
+    ts, idx, cat, stored = insert_reading(conn, r, upsert)
+    return {"inserted": ts, "stored": stored, "pm25_index": idx, "pm25_category": cat}
 
-@app.get("/readings")
-def readings(limit: int = 500, site: Optional[str] = None, window: Optional[str] = Query(default=None, description="e.g. 24h, 7d")):
-    base = "SELECT ts, pm25, co2, temp, rh, pm25_index, pm25_category, site, source FROM readings"
-    where = []
-    params: List = []
+WINDOW_UNITS = {"s": "seconds", "m": "minutes", "min": "minutes", "h": "hours", "d": "days", "w": "weeks"}
+
+def _parse_window(window: str) -> timedelta:
+    """timedelta for a window like 30m, 24h or 7d."""
+    unit = window.lstrip("0123456789.")
+    try:
+        return timedelta(**{WINDOW_UNITS[unit.strip().lower()]: float(window[:-len(unit)])})
+    except (KeyError, ValueError):
+        raise ValueError(f"invalid window: {window!r}") from None
+
+def window_start(conn: sqlite3.Connection, window: str, site: Optional[str] = None) -> Optional[str]:
+    """ISO lower bound for a window like 24h or 7d, anchored at the newest stored reading (of `site` if given)."""
     if site:
-        where.append("site = ?")
-        params.append(site)
-    if window:
-        # window like 24h or 7d
-        import pandas as pd
+        max_ts = conn.execute("SELECT MAX(ts) FROM readings WHERE site = ?", (site,)).fetchone()[0]
+    else:
         max_ts = conn.execute("SELECT MAX(ts) FROM readings").fetchone()[0]
-        if max_ts:
-            now = pd.to_datetime(max_ts)
-            delta = pd.Timedelta(window)
-            start = (now - delta).isoformat()
-            where.append("ts >= ?")
-            params.append(start)
+    if not max_ts:
+        return None
+    return (datetime.fromisoformat(max_ts) - _parse_window(window)).isoformat()
+
+# every filter combination of /readings spelled out once, keyed by (site, since, window, limit)
+def _readings_sql(site: bool, since: bool, window: bool, limit: bool) -> str:
+    where = [c for c, on in (("site = ?", site), ("ts > ?", since), ("ts >= ?", window)) if on]
+    q = "SELECT ts, pm25, co2, temp, rh, pm25_index, pm25_category, site, source FROM readings"
     if where:
-        base += " WHERE " + " AND ".join(where)
-    base += " ORDER BY ts DESC LIMIT ?"
-    params.append(limit)
-    rows = conn.execute(base, tuple(params)).fetchall()
-    cols = ["ts", "pm25", "co2", "temp", "rh", "pm25_index", "pm25_category", "site", "source"]
-    return [dict(zip(cols, r)) for r in rows][::-1]
+        q += " WHERE " + " AND ".join(where)
+    return q + " ORDER BY ts DESC" + (" LIMIT ?" if limit else "")
 
-@app.get("/exposure", response_model=ExposureOut)
-def exposure(window: str = "24h", site: Optional[str] = None):
-    import pandas as pd
-    q = "SELECT ts, pm25_category FROM readings"
+READINGS_SQL = {k: _readings_sql(*k) for k in product((False, True), repeat=4)}
+
+def select_readings(conn: sqlite3.Connection, limit: Optional[int], site: Optional[str], window: Optional[str], since: Optional[str]) -> List[tuple]:
+    """Reading rows in ts order for the /readings filters."""
+    start = window_start(conn, window) if window else None
+    # with a window or since and no explicit limit those are the only bound
+    if limit is None and not window and not since:
+        limit = 500
+    # since is for delta polling: the client already holds everything up to it
+    key = (bool(site), bool(since), start is not None, limit is not None)
+    params = tuple(compress((site, since, start, limit), key))
+    return conn.execute(READINGS_SQL[key], params).fetchall()[::-1]
+
+def columns_payload(rows: List[tuple]) -> Dict:
+    # one list per column: no per-row dicts here, and a cheap DataFrame build for the client
+    return {"columns": {c: list(v) for c, v in zip(READING_COLS, zip(*rows))} if rows else {c: [] for c in READING_COLS}}
+
+@app.get("/readings")
+def readings(limit: Optional[int] = None, site: Optional[str] = None, window: Optional[str] = Query(default=None, description="e.g. 24h, 7d"), layout: str = "rows",
+             since: Optional[str] = Query(default=None, description="only rows newer than this ts"), conn: sqlite3.Connection = Depends(db)):
+    rows = select_readings(conn, limit, site, window, since)
+    if layout == "arrow" and pa is not None:
+        return Response(content=arrow_stream(rows), media_type=ARROW_MEDIA_TYPE)
+    # returning the response skips FastAPI's jsonable_encoder walk, which costs more than
+    # the query and orjson together on large windows; the rows are plain str/float/int
+    if layout in ("columns", "arrow"):
+        return OrjsonResponse(columns_payload(rows))
+    return OrjsonResponse([dict(zip(READING_COLS, r)) for r in rows])
+
+@app.get("/latest")
+def latest(sites: Optional[str] = Query(default=None, description="comma-separated, e.g. Lab,Canteen"), conn: sqlite3.Connection = Depends(db)):
+    # newest reading per site in one query; ts is the primary key so MAX(ts) identifies the row
+    inner = "SELECT MAX(ts) FROM readings"
     params: List = []
-    if site:
-        q += " WHERE site = ?"
-        params.append(site)
+    wanted = [s.strip() for s in sites.split(",") if s.strip()] if sites else []
+    if wanted:
+        inner += " WHERE site IN (" + ",".join("?" * len(wanted)) + ")"
+        params.extend(wanted)
+    inner += " GROUP BY site"
+    q = f"SELECT ts, pm25, co2, temp, rh, pm25_index, pm25_category, site, source FROM readings WHERE ts IN ({inner}) ORDER BY site"
     rows = conn.execute(q, tuple(params)).fetchall()
+    return [dict(zip(READING_COLS, r)) for r in rows]
+
+# SQLite turns ts into epoch seconds (julianday, millisecond resolution) so Python never
+# parses the strings; the lag/sum stays in NumPy, which beats LAG() OVER here
+EXPOSURE_SQL = {
+    has_site: "SELECT (julianday(ts) - 2440587.5) * 86400.0, pm25_category FROM readings WHERE "
+              + ("site = ? AND " if has_site else "") + "ts >= ? ORDER BY ts"
+    for has_site in (False, True)
+}
+
+@app.get("/exposure", response_model=ExposureOut)
+def exposure(window: str = "24h", site: Optional[str] = None, conn: sqlite3.Connection = Depends(db)):
+    import numpy as np
+    # only the window rows leave SQLite, already in ts order (idx_readings_site_ts)
+    start = window_start(conn, window, site)
+    rows = []
+    if start:
+        rows = conn.execute(EXPOSURE_SQL[bool(site)], (site, start) if site else (start,)).fetchall()
     if not rows:
         return ExposureOut(window=window, good=0, satisfactory=0, moderate=0, poor=0, very_poor=0, severe=0)
-    df = pd.DataFrame(rows, columns=["ts", "cat"])
-    df["ts"] = pd.to_datetime(df["ts"])
-    now = df["ts"].max()
-    delta = pd.Timedelta(window)
-    df = df[df["ts"] >= now - delta]
-    df = df.sort_values("ts")
-    if df.empty:
-        return ExposureOut(window=window, good=0, satisfactory=0, moderate=0, poor=0, very_poor=0, severe=0)
-    df["dt"] = df["ts"].diff().dt.total_seconds().fillna(60)
-    minutes = df.groupby("cat")["dt"].sum() / 60.0
-    def m(cat):
-        return int(round(minutes.get(cat, 0)))
+    ts = np.fromiter((r[0] for r in rows), dtype=np.float64, count=len(rows))
+    cats = np.fromiter((_CAT_TO_INT.get(r[1], -1) for r in rows), dtype=np.int8, count=len(rows))
+    # seconds spent since the previous reading; the first one counts as a minute
+    dt = np.empty_like(ts)
+    dt[0] = 60
+    dt[1:] = np.diff(ts)
+    known = cats >= 0
+    minutes = np.bincount(cats[known], weights=dt[known], minlength=len(_CAT)) / 60.0
+    good, satisfactory, moderate, poor, very_poor, severe = (int(round(x)) for x in minutes.tolist())
     return ExposureOut(
         window=window,
-        good=m("Good"),
-        satisfactory=m("Satisfactory"),
-        moderate=m("Moderately Polluted"),
-        poor=m("Poor"),
-        very_poor=m("Very Poor"),
-        severe=m("Severe"),
+        good=good,
+        satisfactory=satisfactory,
+        moderate=moderate,
+        poor=poor,
+        very_poor=very_poor,
+        severe=severe,
     )
 
+SUMMARY_COLS = ["pm25", "co2", "temp", "rh"]
+
+# /stats and /summary filter on an optional site and an optional window start
+SITE_WINDOW_WHERE = {
+    (False, False): "",
+    (True, False): " WHERE site = ?",
+    (False, True): " WHERE ts >= ?",
+    (True, True): " WHERE site = ? AND ts >= ?",
+}
+
+def site_window(site: Optional[str], start: Optional[str]):
+    """(SITE_WINDOW_WHERE key, bind params) for an optional site and window start."""
+    if site:
+        return ((True, True), (site, start)) if start else ((True, False), (site,))
+    return ((False, True), (start,)) if start else ((False, False), ())
+
+_STATS_AGGS = ", ".join(f"MIN({c}), AVG({c}), MAX({c})" for c in SUMMARY_COLS)
+STATS_SQL = {k: f"SELECT COUNT(*), MAX(ts), {_STATS_AGGS} FROM readings{w}" for k, w in SITE_WINDOW_WHERE.items()}
+_SUMMARY_AGGS = ", ".join(f"MIN({c}), AVG({c}), MAX({c}), SUM({c}*{c}), COUNT({c})" for c in SUMMARY_COLS)
+SUMMARY_SQL = {k: f"SELECT COUNT(*), {_SUMMARY_AGGS} FROM readings{w}" for k, w in SITE_WINDOW_WHERE.items()}
+
 @app.get("/stats")
-def stats(window: str = "24h", site: Optional[str] = None) -> Dict:
-    import pandas as pd
-    rows = readings(limit=1000000, site=site, window=window)  # reuse
-    if not rows:
+def stats(window: str = "24h", site: Optional[str] = None, conn: sqlite3.Connection = Depends(db)) -> Dict:
+    # one aggregate pass over the window (idx_readings_site_ts) instead of materializing it
+    key, params = site_window(site, window_start(conn, window))
+    row = conn.execute(STATS_SQL[key], params).fetchone()
+    if not row[0]:
         return {"window": window, "count": 0}
-    df = pd.DataFrame(rows)
-    out = {"window": window, "count": len(df), "last": df["ts"].iloc[-1]}
-    for col in ["pm25", "co2", "temp", "rh"]:
-        if col in df:
-            s = df[col].astype(float)
-            out[col] = {
-                "min": float(s.min()),
-                "mean": float(s.mean()),
-                "max": float(s.max()),
-            }
+    out = {"window": window, "count": row[0], "last": row[1]}
+    for i, c in enumerate(SUMMARY_COLS):
+        lo, mean, hi = row[2 + 3 * i: 5 + 3 * i]
+        out[c] = {"min": lo, "mean": mean, "max": hi}
+    return out
+
+@app.get("/summary")
+def summary(window: str = "24h", site: Optional[str] = None, conn: sqlite3.Connection = Depends(db)) -> Dict:
+    # min/mean/max/std per parameter from one aggregate scan; only 16 numbers leave the DB
+    key, params = site_window(site, window_start(conn, window))
+    row = conn.execute(SUMMARY_SQL[key], params).fetchone()
+    out = {"window": window, "count": row[0]}
+    for i, c in enumerate(SUMMARY_COLS):
+        lo, mean, hi, sq, n = row[1 + 5 * i: 6 + 5 * i]
+        # SQLite has no stddev; sample std from the sum of squares
+        std = math.sqrt(max(0.0, (sq - n * mean * mean) / (n - 1))) if n > 1 else None
+        out[c] = {"min": lo, "mean": mean, "max": hi, "std": std}
     return out
 
 @app.post("/seed")
-def seed(payload: SeedIn):
+def seed(payload: SeedIn, conn: sqlite3.Connection = Depends(db)):
     hours = payload.hours
-    site = payload.site
+    site = payload.site or "Lab"
     period_seconds = payload.period_seconds
     now = datetime.now(timezone.utc)
     n = int(hours * 3600 / period_seconds)
@@ -278,58 +519,64 @@ def seed(payload: SeedIn):
     
     profile = site_profiles.get(site, site_profiles["Lab"])
     
+    import numpy as np
+    rng = np.random.default_rng()
+    # draw every random term up front and build each series as one array expression
+    t_hours = np.arange(n) * (period_seconds / 3600.0)
+    g = rng.standard_normal((n, 6))
+    u = rng.random((n, 3))
+    # daily-ish trend + noise for each parameter
+    pm25 = (profile["pm25_base"] + profile["pm25_trend"] * t_hours
+            + 30 * np.abs(g[:, 0]) * (1 + 0.5 * u[:, 0])
+            + profile["pm25_noise"] * g[:, 1])
+    co2 = (profile["co2_base"] + profile["co2_trend"] * t_hours
+           + 50 * np.abs(g[:, 2])
+           + profile["co2_noise"] * g[:, 3])
+    temp = (profile["temp_base"] + 3 * u[:, 1] * (1 + 0.3 * u[:, 2])
+            + profile["temp_noise"] * g[:, 4])
+    rh = (profile["rh_base"] + profile["rh_trend"] * t_hours
+          + profile["rh_noise"] * g[:, 5])
+    # clamp to realistic ranges in place; values only become Python floats for the insert
+    np.clip(pm25, 5, 350, out=pm25)
+    np.clip(co2, 400, 2000, out=co2)
+    np.clip(temp, 18, 35, out=temp)
+    np.clip(rh, 20, 80, out=rh)
+
+    # classify the whole series at once rather than one sub_index_pm25 call per row
+    idx, cats = sub_index_pm25_vec(pm25)
     # generate backwards in time so ts unique and sorted
-    for i in range(n):
-        ts = now - timedelta(seconds=(n - i) * period_seconds)
-        t_hours = i * period_seconds / 3600.0
-        
-        # Sinusoidal daily pattern + trend + noise for each parameter
-        pm25 = (profile["pm25_base"] + 
-                profile["pm25_trend"] * t_hours + 
-                30 * abs(random.gauss(0, 1)) * (1 + 0.5 * random.random()) +
-                profile["pm25_noise"] * random.gauss(0, 1))
-        pm25 = max(5, min(350, pm25))  # clamp to realistic range
-        
-        co2 = (profile["co2_base"] + 
-               profile["co2_trend"] * t_hours +
-               100 * abs(random.gauss(0, 0.5)) +
-               profile["co2_noise"] * random.gauss(0, 1))
-        co2 = max(400, min(2000, co2))
-        
-        temp = (profile["temp_base"] + 
-                3 * random.random() * (1 + 0.3 * random.random()) +
-                profile["temp_noise"] * random.gauss(0, 1))
-        temp = max(18, min(35, temp))
-        
-        rh = (profile["rh_base"] + 
-              profile["rh_trend"] * t_hours +
-              profile["rh_noise"] * random.gauss(0, 1))
-        rh = max(20, min(80, rh))
-        
-        insert_reading(ReadingIn(ts=ts, pm25=pm25, co2=co2, temp=temp, rh=rh, site=site, source="seed"))
+    # every row shares now's microseconds, so format whole seconds and append the same
+    # fraction; matches datetime.isoformat() without a datetime per row
+    start = int(now.replace(microsecond=0).timestamp()) - n * period_seconds
+    fmt = "%Y-%m-%dT%H:%M:%S" + (f".{now.microsecond:06d}" if now.microsecond else "") + "+00:00"
+    ts = [time.strftime(fmt, time.gmtime(e)) for e in range(start, start + n * period_seconds, period_seconds)]
+    pm25_l, cats_l = pm25.tolist(), cats.tolist()
+    rows = list(zip(ts, pm25_l, co2.tolist(), temp.tolist(), rh.tolist(), idx.tolist(), cats_l, repeat(site), repeat("seed")))
+    alert = np.isin(cats, ALERT_CATS)
+    events = [pm25_event(ts[i], site, pm25_l[i], cats_l[i]) for i in np.flatnonzero(alert).tolist()]
+    insert_readings_bulk(conn, rows, events)
     return {"seeded": n, "site": site, "period_seconds": period_seconds}
 
+EVENT_COLS = ["id", "ts", "site", "type", "severity", "message", "acknowledged"]
+EVENTS_SQL = "SELECT id, ts, site, type, severity, message, acknowledged FROM events ORDER BY ts DESC, id DESC LIMIT ?"
+EVENTS_SITE_SQL = "SELECT id, ts, site, type, severity, message, acknowledged FROM events WHERE site = ? ORDER BY ts DESC, id DESC LIMIT ?"
+
 @app.get("/events")
-def get_events(limit: int = 100, site: Optional[str] = None):
-    q = "SELECT id, ts, site, type, severity, message, acknowledged FROM events"
-    params: List = []
+def get_events(limit: int = 100, site: Optional[str] = None, conn: sqlite3.Connection = Depends(db)):
     if site:
-        q += " WHERE site = ?"
-        params.append(site)
-    q += " ORDER BY ts DESC, id DESC LIMIT ?"
-    params.append(limit)
-    rows = conn.execute(q, tuple(params)).fetchall()
-    cols = ["id","ts","site","type","severity","message","acknowledged"]
-    return [dict(zip(cols, r)) for r in rows]
+        rows = conn.execute(EVENTS_SITE_SQL, (site, limit)).fetchall()
+    else:
+        rows = conn.execute(EVENTS_SQL, (limit,)).fetchall()
+    return [dict(zip(EVENT_COLS, r)) for r in rows]
 
 @app.post("/events/ack")
-def ack_event(event_id: int):
+def ack_event(event_id: int, conn: sqlite3.Connection = Depends(db)):
     conn.execute("UPDATE events SET acknowledged=1 WHERE id=?", (event_id,))
     conn.commit()
     return {"acknowledged": event_id}
 
 @app.post("/reset")
-def reset(site: Optional[str] = None):
+def reset(site: Optional[str] = None, conn: sqlite3.Connection = Depends(db)):
     if site:
         conn.execute("DELETE FROM readings WHERE site=?", (site,))
         conn.execute("DELETE FROM events WHERE site=?", (site,))
@@ -337,4 +584,21 @@ def reset(site: Optional[str] = None):
         conn.execute("DELETE FROM readings")
         conn.execute("DELETE FROM events")
     conn.commit()
-    return {"ok": True}
\ No newline at end of file
+    return {"ok": True}
+
+@app.get("/dashboard")
+def dashboard(site: Optional[str] = None, window: str = "24h", limit: Optional[int] = None, events_limit: int = 50,
+              include_readings: bool = True, conn: sqlite3.Connection = Depends(db)):
+    # everything the dashboard polls, in one round-trip on one connection; health and the
+    # site list stay on / and /sites, which the page polls anyway (/ counts the whole table)
+    out = {
+        "exposure": exposure(window=window, site=site, conn=conn).model_dump(),
+        "events": get_events(limit=events_limit, site=site, conn=conn),
+        "summary": summary(window=window, site=site, conn=conn),
+        "latest": latest(sites=None, conn=conn),
+    }
+    # clients that pull readings as Arrow skip the JSON copy here
+    if include_readings:
+        out["readings"] = columns_payload(select_readings(conn, limit, site, window, None))
+    # everything above is plain JSON types already, so skip jsonable_encoder here too
+    return OrjsonResponse(out)
@@ -11,6 +11,9 @@ parser.add_argument("--jitter", type=float, default=0.2, help="Random jitter fra
 args = parser.parse_args()
 
 API = args.api.rstrip("/")
+INGEST_URL = f"{API}/ingest"
+# one keep-alive connection for the whole run instead of a new socket per post
+session = requests.Session()
 
 # Simple PM2.5 profile that drifts between CPCB bands
 bands = [
@@ -34,7 +37,7 @@ while True:
     rh = random.uniform(30, 75)
     ts = datetime.now(timezone.utc).isoformat()
     try:
-        requests.post(f"{API}/ingest", json={"ts": ts, "pm25": pm25, "co2": co2, "temp": temp, "rh": rh}, timeout=5)
+        session.post(INGEST_URL, json={"ts": ts, "pm25": pm25, "co2": co2, "temp": temp, "rh": rh}, timeout=5)
     except Exception:
         pass
     t = args.period * (1 + random.uniform(-args.jitter, args.jitter))
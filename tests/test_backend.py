@@ -0,0 +1,115 @@
+"""Behavioral checks for the bundled /dashboard, the ETag/304 path and the PM2.5 banding.
+
+Run from the repo root: python -m unittest discover tests (pytest picks these up too).
+"""
+import os
+import tempfile
+import unittest
+
+# point the backend at a throwaway database before it connects at import time
+os.environ["IAQ_DB"] = os.path.join(tempfile.mkdtemp(), "test.db")
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+from backend.main import PM25_BP, app, sub_index_pm25, sub_index_pm25_vec
+
+client = TestClient(app)
+
+
+def reseed():
+    client.post("/reset")
+    for site in ("Lab", "Canteen"):
+        client.post("/seed", json={"hours": 6, "site": site, "period_seconds": 300})
+
+
+class DashboardTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        reseed()
+
+    def test_matches_individual_endpoints(self):
+        for site in (None, "Canteen"):
+            params = {"window": "24h", **({"site": site} if site else {})}
+            bundle = client.get("/dashboard", params=params).json()
+            self.assertEqual(bundle["exposure"], client.get("/exposure", params=params).json())
+            self.assertEqual(bundle["events"], client.get("/events", params={**params, "limit": 50}).json())
+            self.assertEqual(bundle["summary"], client.get("/summary", params=params).json())
+            self.assertEqual(bundle["latest"], client.get("/latest").json())
+            self.assertEqual(bundle["readings"], client.get("/readings", params={**params, "layout": "columns"}).json())
+
+    def test_without_readings(self):
+        bundle = client.get("/dashboard", params={"include_readings": False}).json()
+        self.assertEqual(set(bundle), {"exposure", "events", "summary", "latest"})
+
+    def test_latest_is_newest_per_site(self):
+        latest = {r["site"]: r for r in client.get("/latest").json()}
+        self.assertEqual(set(latest), {"Lab", "Canteen"})
+        for site, row in latest.items():
+            rows = client.get("/readings", params={"site": site}).json()
+            self.assertEqual(row["ts"], max(r["ts"] for r in rows))
+        self.assertEqual([r["site"] for r in client.get("/latest", params={"sites": "Lab"}).json()], ["Lab"])
+
+    def test_summary_std(self):
+        rows = client.get("/readings", params={"site": "Lab", "window": "24h"}).json()
+        pm25 = np.array([r["pm25"] for r in rows])
+        out = client.get("/summary", params={"site": "Lab", "window": "24h"}).json()
+        self.assertEqual(out["count"], len(rows))
+        self.assertAlmostEqual(out["pm25"]["mean"], pm25.mean())
+        self.assertAlmostEqual(out["pm25"]["std"], pm25.std(ddof=1))
+
+
+class ETagTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        reseed()
+
+    def test_not_modified_until_a_write(self):
+        first = client.get("/sites")
+        tag = first.headers["etag"]
+        again = client.get("/sites", headers={"If-None-Match": tag})
+        self.assertEqual(again.status_code, 304)
+        self.assertEqual(again.content, b"")
+        self.assertEqual(again.headers["etag"], tag)
+
+        client.post("/ingest", json={"pm25": 12, "site": "Office"})
+        fresh = client.get("/sites", headers={"If-None-Match": tag})
+        self.assertEqual(fresh.status_code, 200)
+        self.assertNotEqual(fresh.headers["etag"], tag)
+        self.assertIn("Office", fresh.json())
+
+
+class BandTest(unittest.TestCase):
+    # (pm25, index, category) at every breakpoint, inside the gaps between the integer
+    # bands (they belong to the upper band) and past the top of the scale
+    CASES = [
+        (0, 0, "Good"), (30, 50, "Good"),
+        (30.5, 50, "Satisfactory"), (31, 51, "Satisfactory"), (60, 100, "Satisfactory"),
+        (61, 101, "Moderately Polluted"), (90, 200, "Moderately Polluted"),
+        (91, 201, "Poor"), (120, 300, "Poor"),
+        (121, 301, "Very Poor"), (250, 400, "Very Poor"),
+        (251, 401, "Severe"), (350, 500, "Severe"),
+        (351, 600, "Severe"), (400, 649, "Severe"),
+    ]
+
+    def test_breakpoints(self):
+        for v, idx, cat in self.CASES:
+            self.assertEqual(sub_index_pm25(v), (idx, cat), v)
+        self.assertEqual(sub_index_pm25(None), (None, None))
+
+    def test_matches_band_scan_inside_bands(self):
+        # the straightforward scan over PM25_BP that the bisect tables replace
+        for v in np.linspace(0, 350, 3501).tolist():
+            for Blo, Bhi, Ilo, Ihi, cat, _ in PM25_BP:
+                if Blo <= v <= Bhi:
+                    self.assertEqual(sub_index_pm25(v), (int(round((Ihi - Ilo) / (Bhi - Blo) * (v - Blo) + Ilo)), cat), v)
+                    break
+
+    def test_vec_matches_scalar(self):
+        values = [v for v, _, _ in self.CASES] + np.random.default_rng(0).uniform(0, 500, 1000).tolist()
+        idx, cats = sub_index_pm25_vec(np.array(values))
+        self.assertEqual(list(zip(idx.tolist(), cats.tolist())), [sub_index_pm25(v) for v in values])
+
+
+if __name__ == "__main__":
+    unittest.main()